@@ -37,3 +37,39 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def temporary_cache_dir(tmp_path_factory):
+    # Файловые кэши прогона -- во временном каталоге, а не в кэше
+    # запущенного рядом сервера.
+    from django.test.utils import override_settings
+    from yatube.test_runner import temporary_caches
+    cache_settings = override_settings(
+        CACHES=temporary_caches(str(tmp_path_factory.mktemp('cache'))),
+    )
+    cache_settings.enable()
+    yield
+    cache_settings.disable()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(temporary_cache_dir):
+    # Транзакция теста не фиксируется, поколения лент не меняются:
+    # страницы, закэшированные прошлыми тестами, надо сбросить.
+    from django.core.cache import cache
+    cache.clear()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def synchronous_thumbnails():
+    # Тесты с transaction=True фиксируют транзакции: фоновый поток
+    # миниатюр пережил бы тест и его базу.
+    from django.test.utils import override_settings
+    thumbnail_settings = override_settings(THUMBNAIL_WORKERS=0)
+    thumbnail_settings.enable()
+    yield
+    thumbnail_settings.disable()
@@ -1,6 +1,7 @@
 # posts/admin.py
 from django.contrib import admin
 from .models import Post, Group
+from .search import search_post_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -14,6 +15,11 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.filter(id__in=search_post_ids(search_term)), False
+
 
 admin.site.register(Group)
 admin.site.register(Post, PostAdmin)
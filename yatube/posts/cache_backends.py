@@ -0,0 +1,216 @@
+import os
+import pickle
+import tempfile
+import time
+import zlib
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+from .local_cache import MISSING, LocalCache
+
+
+class TwoTierCache(BaseCache):
+    """Бэкенд кэша: небольшой LRU в памяти процесса перед общим
+    для всех воркеров кэшем.
+
+    LOCATION -- алиас общего кэша из CACHES. В OPTIONS:
+    MAX_ENTRIES -- размер LRU, LOCAL_TIMEOUT -- сколько секунд
+    запись живет в LRU (не дольше, чем в общем кэше),
+    LOCAL_BYPASS_PREFIXES -- префиксы ключей, которые читаются
+    только из общего кэша.
+
+    Согласованность держится на версионных ключах: поколения
+    лент (posts.caching) идут мимо LRU, а ключи данных содержат
+    поколение, так что после его смены устаревшие записи LRU
+    просто перестают запрашиваться. Остальные записи другой
+    процесс увидит не позже чем через LOCAL_TIMEOUT.
+
+    Значения в LRU хранятся сериализованными, как в LocMemCache:
+    изменение полученного объекта не портит кэш.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.bypass_prefixes = tuple(
+            options.get('LOCAL_BYPASS_PREFIXES', ())
+        )
+        self.local = LocalCache(self._max_entries, self.local_timeout)
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def get(self, key, default=None, version=None):
+        if self._bypasses_local(key):
+            return self.shared.get(key, default, version)
+        local_key = self._local_key(key, version)
+        pickled = self.local.get(local_key)
+        if pickled is not MISSING:
+            return pickle.loads(pickled)
+        value = self.shared.get(key, MISSING, version)
+        if value is MISSING:
+            return default
+        self._set_local(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            if self._bypasses_local(key):
+                missing.append(key)
+                continue
+            pickled = self.local.get(self._local_key(key, version))
+            if pickled is MISSING:
+                missing.append(key)
+            else:
+                found[key] = pickle.loads(pickled)
+        if missing:
+            shared_values = self.shared.get_many(missing, version)
+            for key, value in shared_values.items():
+                if not self._bypasses_local(key):
+                    self._set_local(self._local_key(key, version), value)
+            found.update(shared_values)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self._set_local(self._local_key(key, version), value, timeout, key)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self._set_local(self._local_key(key, version), value,
+                                timeout, key)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        local_key = self._local_key(key, version)
+        if added:
+            self._set_local(local_key, value, timeout, key)
+        else:
+            # Ключ уже записал кто-то другой: локальная копия
+            # могла устареть.
+            self.local.delete(local_key)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(self._local_key(key, version))
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(self._local_key(key, version))
+        return self.shared.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        self.local.delete(self._local_key(key, version))
+        return self.shared.decr(key, delta, version)
+
+    def has_key(self, key, version=None):
+        if self.local.get(self._local_key(key, version)) is not MISSING:
+            return True
+        return self.shared.has_key(key, version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self._local_key(key, version))
+        self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        self.local.delete(*[self._local_key(key, version) for key in keys])
+        self.shared.delete_many(keys, version)
+
+    def clear(self):
+        # Очищает LRU только этого процесса; в остальных записи
+        # доживут до LOCAL_TIMEOUT.
+        self.local.clear()
+        self.shared.clear()
+
+    def _bypasses_local(self, key):
+        return key.startswith(self.bypass_prefixes)
+
+    def _local_key(self, key, version):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return key
+
+    def _set_local(self, local_key, value, timeout=None, key=None):
+        if key is not None and self._bypasses_local(key):
+            return
+        if timeout in (None, DEFAULT_TIMEOUT):
+            timeout = self.local_timeout
+        timeout = min(timeout, self.local_timeout)
+        if timeout <= 0:
+            self.local.delete(local_key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.local.set(local_key, pickled, timeout)
+
+
+class SharedFileCache(FileBasedCache):
+    """Файловый кэш, общий для воркеров одной машины, с атомарным add.
+
+    Файл ключа в add создается жесткой ссылкой на временный файл:
+    если ключ параллельно добавил другой процесс, os.link падает,
+    и add возвращает False. На этом держатся блокировки
+    перерисовки лент (posts.caching).
+
+    incr меняет значение на месте под блокировкой файла и сохраняет
+    срок жизни ключа: BaseCache.incr перезаписал бы ключ со сроком
+    по умолчанию, и вечные поколения лент истекали бы.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self.has_key(key, version):
+            return False
+        self._createdir()
+        self._cull()
+        fname = self._key_to_file(key, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            os.link(tmp_path, fname)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        try:
+            with open(self._key_to_file(key, version), 'r+b') as f:
+                try:
+                    locks.lock(f, locks.LOCK_EX)
+                    expiry = pickle.load(f)
+                    if expiry is not None and expiry < time.time():
+                        raise ValueError("Key '%s' not found" % key)
+                    value = pickle.loads(zlib.decompress(f.read())) + delta
+                    f.seek(0)
+                    f.write(pickle.dumps(expiry, self.pickle_protocol))
+                    f.write(zlib.compress(
+                        pickle.dumps(value, self.pickle_protocol)
+                    ))
+                    f.truncate()
+                    return value
+                finally:
+                    locks.unlock(f)
+        except FileNotFoundError:
+            raise ValueError("Key '%s' not found" % key)
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version)
+
+    def has_key(self, key, version=None):
+        try:
+            return super().has_key(key, version)
+        except FileNotFoundError:
+            # Файл удалил другой процесс между проверкой и открытием.
+            return False
@@ -0,0 +1,273 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.cache import (get_cache_key, learn_cache_key,
+                                patch_response_headers)
+from django.views.decorators.http import condition
+
+from .models import Group, Post, User
+from .routers import is_pinned_to_primary
+
+
+GENERATION_KEY: str = 'feed_generation:{scope}'
+MODIFIED_KEY: str = 'feed_modified:{scope}'
+LOCK_KEY: str = 'feed_lock:{key}'
+# Блокировки лежат в отдельном небольшом кэше: вытеснение записей
+# общего кэша их не задевает.
+LOCK_CACHE: str = 'locks'
+LOCK_POLL_INTERVAL: float = 0.05
+# Значение блокировки после ответа, который нельзя кэшировать:
+# ждущим запросам копии не дождаться, они рисуют страницу сами.
+NOT_CACHEABLE: str = 'not_cacheable'
+
+
+def _new_generation():
+    # Поколение после вытеснения ключа из кэша должно быть больше
+    # любого выданного ранее, поэтому начинаем с текущего времени.
+    return int(time.time() * 1000)
+
+
+def get_generation(scope):
+    key = GENERATION_KEY.format(scope=scope)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _new_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_post_card_key(post):
+    """Ключ карточки: версия поста меняется при каждой правке,
+    поколение автора -- при смене его имени.
+    """
+    author_generation = get_generation(f'author:{post.author_id}')
+    return 'post_card:{}:{}:{}'.format(post.pk,
+                                       post.version,
+                                       author_generation)
+
+
+def get_count_key(scope):
+    return 'feed_count:{}:{}'.format(scope, get_generation(scope))
+
+
+def get_profile_scopes(*author_ids):
+    usernames = User.objects.filter(
+        id__in=author_ids,
+    ).values_list('username', flat=True)
+    return [f'profile:{username}' for username in usernames]
+
+
+def get_group_scopes(*group_ids):
+    slugs = Group.objects.filter(
+        id__in=[group_id for group_id in group_ids if group_id],
+    ).values_list('slug', flat=True)
+    return [f'group:{slug}' for slug in slugs]
+
+
+def get_post_scopes(post_id):
+    """Области, которые страница поста выводит кроме самого поста:
+    профиль автора (имя, число постов) и группа.
+    """
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author__username', 'group__slug',
+    ).first()
+    if row is None:
+        return []
+    username, slug = row
+    scopes = [f'profile:{username}']
+    if slug:
+        scopes.append(f'group:{slug}')
+    return scopes
+
+
+def bump_generation(*scopes):
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope=scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_generation(), None)
+    modified = time.time()
+    cache.set_many(
+        {MODIFIED_KEY.format(scope=scope): modified for scope in scopes},
+        None,
+    )
+
+
+def get_modified(*scopes):
+    """Время последней записи в ленты или None, если его
+    не запомнили хотя бы для одной (ключ вытеснен или записей
+    еще не было).
+    """
+    keys = [MODIFIED_KEY.format(scope=scope) for scope in scopes]
+    values = cache.get_many(keys)
+    if len(values) < len(keys):
+        return None
+    return datetime.fromtimestamp(max(values.values()), tz=timezone.utc)
+
+
+def get_feed_etag(request, scope, generation):
+    """ETag страницы: поколение ленты и куки, от которых зависят
+    дорисованные части (шапка, кнопки, форма с CSRF-токеном).
+    """
+    viewer = '|'.join([
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ])
+    raw = f'{scope}|{generation}|{viewer}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def acquire_refresh_lock(key):
+    return caches[LOCK_CACHE].add(LOCK_KEY.format(key=key), True,
+                                  settings.FEED_CACHE_LOCK_TIMEOUT)
+
+
+def release_refresh_lock(key, cacheable=True):
+    lock_key = LOCK_KEY.format(key=key)
+    if cacheable:
+        caches[LOCK_CACHE].delete(lock_key)
+    else:
+        caches[LOCK_CACHE].set(lock_key, NOT_CACHEABLE,
+                               settings.FEED_CACHE_LOCK_WAIT)
+
+
+def _is_cacheable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and 'private' not in response.get('Cache-Control', '')
+    )
+
+
+def _render_and_store(request, render_page, key_prefix):
+    response = render_page()
+    if not _is_cacheable(response):
+        return response
+    soft_timeout = settings.FEED_CACHE_SOFT_TIMEOUT
+    hard_timeout = settings.FEED_CACHE_TIMEOUT
+    patch_response_headers(response, soft_timeout)
+    key = learn_cache_key(request, response, hard_timeout, key_prefix,
+                          cache=cache)
+    if hasattr(response, 'render') and callable(response.render):
+        response.add_post_render_callback(
+            lambda rendered: cache.set(
+                key, (rendered, time.time() + soft_timeout), hard_timeout,
+            )
+        )
+    else:
+        cache.set(key, (response, time.time() + soft_timeout), hard_timeout)
+    return response
+
+
+def _wait_for_page(request, key_prefix, lock_key):
+    deadline = time.monotonic() + settings.FEED_CACHE_LOCK_WAIT
+    lock_cache = caches[LOCK_CACHE]
+    while lock_cache.get(LOCK_KEY.format(key=lock_key)) != NOT_CACHEABLE:
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(LOCK_POLL_INTERVAL)
+        key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+        entry = cache.get(key) if key else None
+        if entry is not None:
+            return entry[0]
+    return None
+
+
+def serve_stale_while_revalidate(request, key_prefix, render_page):
+    """Отдает страницу из кэша; после мягкого срока
+    (FEED_CACHE_SOFT_TIMEOUT) страницу перерисовывает ровно один
+    запрос, остальные получают устаревшую копию.
+
+    Если копии нет совсем, рисует тот, кто взял блокировку;
+    остальные ждут его результат до FEED_CACHE_LOCK_WAIT секунд
+    и только потом рисуют сами. Если ответ нельзя кэшировать,
+    блокировка отпускается с отметкой NOT_CACHEABLE, и ждущие
+    рисуют страницу сразу.
+    """
+    key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+    entry = cache.get(key) if key else None
+    if entry is not None:
+        response, fresh_until = entry
+        if time.time() < fresh_until or not acquire_refresh_lock(key):
+            return response
+        try:
+            return _render_and_store(request, render_page, key_prefix)
+        finally:
+            release_refresh_lock(key)
+    # Ключ страницы зависит от заголовков Vary ответа, которые
+    # еще не известны: блокируем по ключу запроса без них.
+    lock_key = key or '{}:{}'.format(key_prefix, request.get_full_path())
+    if acquire_refresh_lock(lock_key):
+        cacheable = False
+        try:
+            response = _render_and_store(request, render_page, key_prefix)
+            cacheable = _is_cacheable(response)
+            return response
+        finally:
+            release_refresh_lock(lock_key, cacheable)
+    response = _wait_for_page(request, key_prefix, lock_key)
+    if response is not None:
+        return response
+    return _render_and_store(request, render_page, key_prefix)
+
+
+def cache_feed(scope, depends_on=None):
+    """Кэширует страницу ленты под ключом текущего поколения
+    со схемой stale-while-revalidate (см. serve_stale_while_revalidate)
+    и отвечает 304 на условные запросы, не трогая кэш страниц
+    (и базу, если не задан depends_on).
+
+    scope -- шаблон области ленты, подставляются аргументы
+    представления: 'index', 'group:{slug}', 'profile:{username}',
+    'post:{post_id}'.
+
+    depends_on -- функция от аргументов представления, возвращающая
+    другие области, которые выводит страница; их поколения тоже
+    входят в ключ страницы и ETag.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+            scope_name = scope.format(**kwargs)
+            scopes = [scope_name]
+            if depends_on is not None:
+                scopes.extend(depends_on(**kwargs))
+            generation = '.'.join(
+                str(get_generation(name)) for name in scopes
+            )
+            key_prefix = 'feed:{}:{}'.format(scope_name, generation)
+            if is_pinned_to_primary():
+                # Копию в кэше могли нарисовать по отстающей реплике:
+                # после своей записи пользователь получает страницу
+                # из основной базы, и она же заменяет копию.
+                return _render_and_store(
+                    request,
+                    lambda: view_func(request, *args, **kwargs),
+                    key_prefix,
+                )
+
+            def etag(request, *args, **kwargs):
+                return get_feed_etag(request, scope_name, generation)
+
+            def last_modified(request, *args, **kwargs):
+                return get_modified(*scopes)
+
+            @condition(etag_func=etag, last_modified_func=last_modified)
+            def serve(request, *args, **kwargs):
+                return serve_stale_while_revalidate(
+                    request,
+                    key_prefix,
+                    lambda: view_func(request, *args, **kwargs),
+                )
+
+            return serve(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,158 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+
+from .caching import bump_generation
+from .counters import change_comment_count
+from .models import Comment, Post
+from .search import get_backend
+
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = []
+_timer = None
+
+
+def submit_comment(comment):
+    """Сохраняет новый комментарий.
+
+    В режиме COMMENT_WRITE_BEHIND комментарий ставится в очередь
+    процесса и пишется пачкой через bulk_create: когда наберется
+    COMMENT_BATCH_SIZE штук или пройдет COMMENT_BATCH_DELAY секунд
+    с первого в пачке. Гарантии записи слабее, чем у синхронного
+    режима: до сброса комментарий виден только в очереди и теряется
+    при падении процесса (при обычном завершении очередь
+    сбрасывается). Если очередь переполнена (COMMENT_QUEUE_LIMIT),
+    комментарий пишется сразу.
+    """
+    if settings.COMMENT_WRITE_BEHIND and _enqueue(comment):
+        return
+    save_comment(comment)
+
+
+def save_comment(comment):
+    """Синхронная запись одного комментария с сигналами."""
+    if comment.parent_id is not None:
+        comment.parent = Comment.objects.filter(
+            id=comment.parent_id, post_id=comment.post_id,
+        ).first()
+    with transaction.atomic():
+        comment.save()
+
+
+def _enqueue(comment):
+    global _timer
+    with _lock:
+        if len(_pending) >= settings.COMMENT_QUEUE_LIMIT:
+            return False
+        _pending.append(comment)
+        batch_full = len(_pending) >= settings.COMMENT_BATCH_SIZE
+        if not batch_full and _timer is None:
+            _timer = threading.Timer(settings.COMMENT_BATCH_DELAY,
+                                     _flush_in_worker)
+            _timer.daemon = True
+            _timer.start()
+    if batch_full:
+        # Пачку пишет запрос, который ее заполнил: писатели
+        # притормаживают, а очередь не растет.
+        flush_comments()
+    return True
+
+
+def flush_comments():
+    """Записывает все комментарии из очереди; возвращает их число."""
+    global _timer
+    with _lock:
+        batch = _pending[:]
+        del _pending[:]
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if batch:
+        write_comments(batch)
+    return len(batch)
+
+
+def _flush_in_worker():
+    try:
+        flush_comments()
+    finally:
+        close_old_connections()
+
+
+def write_comments(comments):
+    """Пишет пачку комментариев одной транзакцией и делает то же,
+    что сигналы post_save каждого из них: счетчики, поиск, кэш.
+
+    Комментарии к удаленным постам отбрасываются, ответы
+    на комментарии других постов становятся корневыми. Если пачка
+    не записалась, комментарии пишутся по одному.
+    """
+    batch = _prepare_batch(comments)
+    if not batch:
+        return
+    try:
+        post_ids = _write_batch(batch)
+    except DatabaseError:
+        logger.exception('Пачка комментариев не записана, пишем по одному')
+        _write_one_by_one(batch)
+        return
+    bump_generation(*(f'post:{post_id}' for post_id in post_ids))
+
+
+def _prepare_batch(comments):
+    """Отбрасывает комментарии к удаленным постам и строит пути."""
+    post_ids = set(Post.objects.filter(
+        id__in={comment.post_id for comment in comments},
+    ).values_list('id', flat=True))
+    parents = Comment.objects.in_bulk(
+        {comment.parent_id for comment in comments if comment.parent_id}
+    )
+    batch = []
+    for comment in comments:
+        if comment.post_id not in post_ids:
+            logger.warning('Пост %s удален, комментарий отброшен',
+                           comment.post_id)
+            continue
+        parent = parents.get(comment.parent_id)
+        if parent is not None and parent.post_id != comment.post_id:
+            parent = None
+        comment.parent = parent
+        comment.build_path()
+        batch.append(comment)
+    return batch
+
+
+def _write_batch(batch):
+    """Пишет пачку, счетчики и поиск; возвращает id постов."""
+    with transaction.atomic():
+        Comment.objects.bulk_create(batch)
+        # SQLite не возвращает ключи из bulk_create: находим
+        # строки по пути, пара (post, path) уникальна.
+        saved = list(Comment.objects.filter(
+            post_id__in={comment.post_id for comment in batch},
+            path__in=[comment.path for comment in batch],
+        ))
+        counts = Counter(comment.post_id for comment in saved)
+        for post_id, count in counts.items():
+            change_comment_count(post_id, count)
+        get_backend().index_comments(saved)
+    return list(counts)
+
+
+def _write_one_by_one(batch):
+    for comment in batch:
+        try:
+            with transaction.atomic():
+                comment.save()
+        except DatabaseError:
+            logger.exception('Комментарий не записан')
+
+
+atexit.register(flush_comments)
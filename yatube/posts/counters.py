@@ -0,0 +1,117 @@
+from django.db import router
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import (Comment, Follow, MediaFile, Post, UploadMetric, User,
+                     UserStats)
+
+
+def _count_subquery(queryset, field):
+    counted = queryset.filter(
+        **{field: OuterRef('pk')},
+    ).order_by().values(field).annotate(
+        total=Count('pk'),
+    ).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def recount_user_stats(user_ids=None):
+    # Считаем по той базе, куда пишем: реплика может отставать.
+    users = User.objects.using(router.db_for_write(UserStats))
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    users = users.annotate(
+        posts_total=_count_subquery(Post.objects, 'author'),
+        followers_total=_count_subquery(Follow.objects, 'author'),
+        following_total=_count_subquery(Follow.objects, 'user'),
+    ).values_list('pk', 'posts_total', 'followers_total', 'following_total')
+    stats = [
+        UserStats(user_id=pk,
+                  posts_count=posts,
+                  followers_count=followers,
+                  following_count=following)
+        for pk, posts, followers, following in users.iterator()
+    ]
+    UserStats.objects.bulk_create(stats, ignore_conflicts=True)
+    UserStats.objects.bulk_update(
+        stats,
+        ['posts_count', 'followers_count', 'following_count'],
+        batch_size=500,
+    )
+    return len(stats)
+
+
+def recount_comment_counts():
+    return Post.objects.update(
+        comment_count=_count_subquery(Comment.objects, 'post'),
+    )
+
+
+def recount_media_references(names=None):
+    posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+    if names is not None:
+        posts = posts.filter(image__in=names)
+    totals = posts.order_by().values_list('image').annotate(
+        total=Count('pk'),
+    )
+    files = [
+        MediaFile(name=name, references=total)
+        for name, total in totals.iterator()
+    ]
+    MediaFile.objects.bulk_create(files, ignore_conflicts=True)
+    MediaFile.objects.bulk_update(files, ['references'], batch_size=500)
+    if names is not None:
+        counted = {media_file.name for media_file in files}
+        MediaFile.objects.filter(
+            name__in=set(names) - counted,
+        ).update(references=0)
+    return len(files)
+
+
+def get_user_stats(user):
+    stats = UserStats.objects.filter(user=user).first()
+    if stats is None:
+        recount_user_stats([user.pk])
+        stats = UserStats.objects.using(
+            router.db_for_write(UserStats),
+        ).get(user=user)
+    return stats
+
+
+def change_user_stats(user_id, create=True, **deltas):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated and create:
+        # Строки еще нет: считаем значения по таблицам целиком,
+        # текущее изменение в них уже учтено.
+        recount_user_stats([user_id])
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F('comment_count') + delta,
+    )
+
+
+def change_media_references(name, delta):
+    references = MediaFile.objects.filter(name=name)
+    if delta < 0:
+        references = references.filter(references__gte=-delta)
+    updated = references.update(references=F('references') + delta)
+    if not updated and delta > 0:
+        recount_media_references([name])
+
+
+def change_upload_metrics(**deltas):
+    for name, delta in deltas.items():
+        updated = UploadMetric.objects.filter(name=name).update(
+            value=F('value') + delta,
+        )
+        if not updated:
+            UploadMetric.objects.bulk_create(
+                [UploadMetric(name=name)], ignore_conflicts=True,
+            )
+            UploadMetric.objects.filter(name=name).update(
+                value=F('value') + delta,
+            )
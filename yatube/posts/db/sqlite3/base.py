@@ -0,0 +1,51 @@
+from django.db.backends.sqlite3 import base
+
+
+# Значения по умолчанию; переопределяются ключом 'pragmas' в OPTIONS.
+DEFAULT_PRAGMAS = {
+    # Читатели не ждут писателя, а писатель -- читателей.
+    'journal_mode': 'WAL',
+    # В режиме WAL база не портится и без fsync на каждой фиксации;
+    # при сбое питания теряются только последние транзакции.
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение -- размер в КиБ, а не в страницах.
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+# Ключи OPTIONS этого движка; в sqlite3.connect они не передаются.
+BACKEND_OPTIONS = ('pragmas', 'transaction_mode')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite с настройками для нескольких потоков и процессов.
+
+    Каждое новое соединение получает PRAGMA из DEFAULT_PRAGMAS.
+    Транзакции (atomic) начинаются с BEGIN IMMEDIATE: блокировка
+    записи берется сразу, и ожидание идет по busy_timeout, а не
+    заканчивается ошибкой «database is locked» при попытке
+    читающей транзакции начать запись. Режим меняется ключом
+    'transaction_mode' в OPTIONS.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for option in BACKEND_OPTIONS:
+            params.pop(option, None)
+        return params
+
+    def get_pragmas(self):
+        options = self.settings_dict['OPTIONS']
+        return {**DEFAULT_PRAGMAS, **options.get('pragmas', {})}
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.get_pragmas().items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode',
+                                                 'IMMEDIATE')
+        self.cursor().execute(f'BEGIN {mode}')
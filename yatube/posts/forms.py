@@ -1,5 +1,7 @@
 # posts/forms.py
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
+from .images import normalize_image
 from .models import Post, Comment
 
 
@@ -24,6 +26,12 @@ class PostForm(ModelForm):
             'image': 'Можно прикрепить картинку',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return normalize_image(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
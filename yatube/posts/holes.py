@@ -0,0 +1,75 @@
+import re
+from urllib.parse import parse_qsl, urlencode
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .forms import CommentForm
+from .models import Follow
+
+
+# Пользовательский текст шаблоны экранируют, поэтому подделать
+# маркер постом или комментарием нельзя.
+HOLE_MARKER: str = '<!--hole:{name}:{params}-->'
+HOLE_PATTERN = re.compile(r'<!--hole:(\w+):([^>]*)-->')
+
+
+def hole_marker(name, **params):
+    return mark_safe(HOLE_MARKER.format(name=name, params=urlencode(params)))
+
+
+def header_context(request):
+    return {}
+
+
+def switcher_context(request, active=''):
+    return {'active': active}
+
+
+def follow_button_context(request, author):
+    following = (
+        request.user.is_authenticated
+        and request.user.username != author
+        and Follow.objects.filter(
+            user=request.user, author__username=author,
+        ).exists()
+    )
+    return {'author': author, 'following': following}
+
+
+def post_edit_link_context(request, post_id, author):
+    return {'post_id': post_id, 'author': author}
+
+
+def comment_form_context(request, post_id):
+    # Без JavaScript ссылка «Ответить» ведет на ?reply_to=<id>.
+    return {'post_id': post_id, 'form': CommentForm(),
+            'reply_to': request.GET.get('reply_to', '')}
+
+
+# Части страниц, которые зависят от пользователя: имя дырки ->
+# (шаблон, функция контекста). Параметры приходят из маркера строками.
+HOLES = {
+    'header': ('includes/header.html', header_context),
+    'switcher': ('posts/includes/switcher.html', switcher_context),
+    'follow_button': ('posts/includes/follow_button.html',
+                      follow_button_context),
+    'post_edit_link': ('posts/includes/post_edit_link.html',
+                       post_edit_link_context),
+    'comment_form': ('posts/includes/comment_form.html',
+                     comment_form_context),
+}
+
+
+def fill_holes(request, content):
+    """Заменяет маркеры дырок на части страницы, отрисованные
+    для текущего пользователя.
+    """
+    def render_hole(match):
+        template_name, get_context = HOLES[match.group(1)]
+        params = dict(parse_qsl(match.group(2)))
+        return render_to_string(template_name,
+                                get_context(request, **params),
+                                request=request)
+
+    return HOLE_PATTERN.sub(render_hole, content)
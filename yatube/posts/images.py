@@ -0,0 +1,109 @@
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+from .counters import change_upload_metrics
+from .models import UploadMetric
+
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('uploads', 'bytes_in', 'bytes_stored')
+
+# Параметры перекодирования по формату исходника: формат и имя
+# файла сохраняются, меняется только содержимое.
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'GIF': {'optimize': True},
+    'WEBP': {'quality': 80, 'method': 6},
+}
+JPEG_MODES = ('RGB', 'L')
+# Ключи image.info с метаданными: Pillow записывает их обратно
+# при сохранении (PNG и WebP -- даже без явного exif=).
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment')
+
+
+def validate_upload(upload, image):
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)s.',
+            code='file_too_large',
+            params={
+                'limit': filesizeformat(settings.POST_IMAGE_MAX_UPLOAD_SIZE),
+            },
+        )
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка %(width)sx%(height)s слишком большая.',
+            code='image_too_large',
+            params={'width': width, 'height': height},
+        )
+
+
+def normalize_image(upload):
+    """Проверяет загруженную картинку, поворачивает ее по EXIF,
+    удаляет метаданные, уменьшает до POST_IMAGE_MAX_EDGE
+    и перекодирует в том же формате.
+
+    Возвращает исходный файл, если перекодирование ничего не дало.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    validate_upload(upload, image)
+    image_format = image.format
+    if getattr(image, 'is_animated', False) or (
+            image_format not in SAVE_OPTIONS):
+        record_upload(upload.size, upload.size)
+        return upload
+    has_metadata = any(image.info.get(key) for key in METADATA_KEYS)
+    image = ImageOps.exif_transpose(image)
+    for key in METADATA_KEYS:
+        image.info.pop(key, None)
+    max_edge = settings.POST_IMAGE_MAX_EDGE
+    resized = max(image.size) > max_edge
+    if resized:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in JPEG_MODES:
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **SAVE_OPTIONS[image_format])
+    size = buffer.tell()
+    if not resized and not has_metadata and size >= upload.size:
+        upload.seek(0)
+        record_upload(upload.size, upload.size)
+        return upload
+    buffer.seek(0)
+    record_upload(upload.size, size)
+    return InMemoryUploadedFile(
+        buffer,
+        field_name=getattr(upload, 'field_name', None),
+        name=upload.name,
+        content_type=Image.MIME.get(image_format, upload.content_type),
+        size=size,
+        charset=None,
+    )
+
+
+def record_upload(bytes_in, bytes_stored):
+    logger.info('Картинка поста: %s байт загружено, %s сохранено',
+                bytes_in, bytes_stored)
+    change_upload_metrics(uploads=1, bytes_in=bytes_in,
+                          bytes_stored=bytes_stored)
+
+
+def get_upload_metrics():
+    values = dict(
+        UploadMetric.objects.filter(name__in=METRICS).values_list(
+            'name', 'value',
+        )
+    )
+    metrics = {name: values.get(name, 0) for name in METRICS}
+    metrics['bytes_saved'] = metrics['bytes_in'] - metrics['bytes_stored']
+    return metrics
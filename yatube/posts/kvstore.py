@@ -0,0 +1,115 @@
+import logging
+import threading
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .local_cache import MISSING, LocalCache
+from .models import Post
+from .storage import content_storage
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCachedKVStore(KVStore):
+    """Хранилище метаданных sorl-thumbnail в три слоя: LRU в памяти
+    процесса, кэш Django и таблица sorl как долговременная копия.
+
+    При первом обращении в процессе LRU прогревается записями
+    картинок последних постов, поэтому отрисовка ленты не делает
+    ни одного запроса к базе за миниатюрами. Отсутствующие ключи
+    тоже запоминаются: бэкенд (posts.thumbnails) в этом случае
+    проверяет файл, а не базу.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.local = LocalCache(
+            settings.THUMBNAIL_LOCAL_CACHE_SIZE,
+            settings.THUMBNAIL_LOCAL_CACHE_TIMEOUT,
+        )
+        self._warmed = False
+        self._warm_lock = threading.Lock()
+
+    def warm(self, limit=None):
+        """Загружает в LRU и кэш Django записи картинок последних
+        limit постов и их миниатюр. Возвращает число ключей.
+        """
+        if limit is None:
+            limit = settings.THUMBNAIL_WARM_POSTS
+        names = Post.objects.exclude(image='').exclude(
+            image__isnull=True,
+        ).order_by('-pub_date').values_list('image', flat=True)[:limit]
+        source_keys = [
+            ImageFile(name, content_storage).key for name in set(names)
+        ]
+        keys = [
+            add_prefix(key, identity)
+            for key in source_keys
+            for identity in ('image', 'thumbnails')
+        ]
+        values = self._load(keys)
+        thumbnail_keys = [
+            add_prefix(thumbnail_key)
+            for key in source_keys
+            for thumbnail_key in deserialize(
+                values.get(add_prefix(key, 'thumbnails')) or '[]'
+            )
+        ]
+        values.update(self._load(thumbnail_keys))
+        for key in [*keys, *thumbnail_keys]:
+            value = values.get(key)
+            self.local.set(key, value)
+            if value is not None:
+                self.cache.set(key, value,
+                               sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        self._warmed = True
+        return len(keys) + len(thumbnail_keys)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        self.local.clear()
+
+    def _load(self, keys):
+        if not keys:
+            return {}
+        return dict(
+            KVStoreModel.objects.filter(key__in=keys).values_list(
+                'key', 'value',
+            )
+        )
+
+    def _warm_once(self):
+        if self._warmed:
+            return
+        with self._warm_lock:
+            if self._warmed:
+                return
+            try:
+                self.warm()
+            except Exception:
+                logger.exception('Не удалось прогреть кэш миниатюр')
+            finally:
+                self._warmed = True
+
+    def _get_raw(self, key):
+        self._warm_once()
+        value = self.local.get(key)
+        if value is MISSING:
+            value = super()._get_raw(key)
+            self.local.set(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self.local.set(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self.local.delete(*keys)
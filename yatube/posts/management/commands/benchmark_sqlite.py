@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from .loadtest_feed import percentile
+
+
+User = get_user_model()
+
+BENCHMARK_USERNAME: str = 'benchmark'
+# Настройки базы до posts.db.sqlite3: журнал DELETE, PRAGMA
+# по умолчанию, новое соединение на каждый запрос.
+PLAIN_DATABASE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'OPTIONS': {},
+    'CONN_MAX_AGE': 0,
+}
+# Страницы не кэшируются: меряется база, а не кэш лент.
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+@contextmanager
+def database_copy(**overrides):
+    """Подменяет базу default копией текущей с настройками overrides
+    для всех соединений, открытых внутри блока.
+    """
+    settings_dict = connections.databases[DEFAULT_DB_ALIAS]
+    saved = dict(settings_dict)
+    temp_dir = tempfile.mkdtemp()
+    name = os.path.join(temp_dir, 'db.sqlite3')
+    connections.close_all()
+    with sqlite3.connect(saved['NAME']) as source, \
+            sqlite3.connect(name) as target:
+        source.backup(target)
+    if overrides.get('ENGINE') == PLAIN_DATABASE['ENGINE']:
+        with sqlite3.connect(name) as target:
+            target.execute('PRAGMA journal_mode = DELETE')
+    settings_dict.update(overrides, NAME=name)
+    # Обертка соединения создается по ENGINE один раз на поток.
+    connections._connections.__dict__.pop(DEFAULT_DB_ALIAS, None)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        settings_dict.clear()
+        settings_dict.update(saved)
+        connections._connections.__dict__.pop(DEFAULT_DB_ALIAS, None)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает чтение лент и запись комментариев в несколько '
+            'потоков на SQLite с настройками по умолчанию '
+            'и с posts.db.sqlite3. Работает на копиях базы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Сравнение имеет смысл только для SQLite.')
+        configurations = {
+            'plain': PLAIN_DATABASE,
+            'tuned': {},
+        }
+        self.stdout.write(f'{"база":>6} {"путь":>9} {"запросов/с":>11} '
+                          f'{"p50, мс":>9} {"p99, мс":>9} {"ошибок":>7}')
+        for name, overrides in configurations.items():
+            with database_copy(**overrides), \
+                    override_settings(CACHES=NO_CACHE):
+                results = self.run_benchmark(options)
+            for path, (elapsed, latencies, errors) in results.items():
+                if not latencies:
+                    raise CommandError('Не выполнено ни одного запроса.')
+                self.stdout.write(
+                    f'{name:>6} {path:>9} {len(latencies) / elapsed:11.1f} '
+                    f'{percentile(latencies, 0.5):9.2f} '
+                    f'{percentile(latencies, 0.99):9.2f} '
+                    f'{errors:7}'
+                )
+
+    def run_benchmark(self, options):
+        post = Post.objects.first()
+        if post is None:
+            raise CommandError('Нет поста для комментариев.')
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        read_addrs = [
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ]
+        write_addr = reverse('posts:add_comment',
+                             kwargs={'post_id': post.pk})
+
+        def read(client, sent):
+            addr = read_addrs[sent % len(read_addrs)]
+            return client.get(addr).status_code == 200
+
+        def write(client, sent):
+            response = client.post(write_addr, {'text': f'Benchmark {sent}'})
+            return response.status_code == 302
+
+        # Процессы, а не потоки: как воркеры сервера приложений,
+        # они не делят GIL, и общим ресурсом остается только база.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        started = time.perf_counter()
+        deadline = started + options['seconds']
+        workers = [
+            context.Process(target=run_worker,
+                            args=('feed', read, None, deadline, results))
+            for _ in range(options['readers'])
+        ] + [
+            context.Process(target=run_worker,
+                            args=('comments', write, user, deadline,
+                                  results))
+            for _ in range(options['writers'])
+        ]
+        for worker in workers:
+            worker.start()
+        samples = {'feed': ([], 0), 'comments': ([], 0)}
+        for _ in workers:
+            path, latencies, errors = results.get()
+            path_latencies, path_errors = samples[path]
+            samples[path] = (path_latencies + latencies,
+                             path_errors + errors)
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        return {
+            path: (elapsed, latencies, errors)
+            for path, (latencies, errors) in samples.items()
+        }
+
+
+def run_worker(path, request, user, deadline, results):
+    client = Client(SERVER_NAME='localhost')
+    if user is not None:
+        client.force_login(user)
+    latencies = []
+    errors = 0
+    sent = 0
+    try:
+        while time.perf_counter() < deadline:
+            sent += 1
+            request_started = time.perf_counter()
+            try:
+                failed = not request(client, sent)
+            except Exception:
+                failed = True
+            latencies.append((time.perf_counter() - request_started) * 1000)
+            errors += failed
+    finally:
+        connection.close()
+        results.put((path, latencies, errors))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Создает производные картинок постов всех ширин '
+            'и форматов для srcset.')
+
+    def handle(self, *args, **options):
+        image_names = Post.objects.exclude(
+            image='',
+        ).exclude(
+            image__isnull=True,
+        ).order_by().values_list('image', flat=True).distinct()
+        total = derivatives = 0
+        for image_name in image_names.iterator():
+            derivatives += generate_thumbnails(image_name)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {total}, '
+            f'создано производных: {derivatives}'
+        ))
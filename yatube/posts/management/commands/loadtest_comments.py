@@ -0,0 +1,110 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.comment_queue import flush_comments
+from posts.models import Comment, Post
+
+from .loadtest_feed import percentile
+
+
+User = get_user_model()
+
+LOADTEST_USERNAME: str = 'loadtest'
+MODES = {
+    'sync': False,
+    'write-behind': True,
+}
+
+
+class Command(BaseCommand):
+    help = ('Пишет комментарии к одному посту в несколько потоков '
+            'синхронно и через очередь (COMMENT_WRITE_BEHIND) '
+            'и сравнивает пропускную способность.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--post', type=int,
+                            help='id поста, по умолчанию последний')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=int, default=10)
+        parser.add_argument('--mode', choices=[*MODES, 'both'],
+                            default='both')
+
+    def handle(self, *args, **options):
+        post = (Post.objects.filter(pk=options['post']).first()
+                if options['post'] else Post.objects.first())
+        if post is None:
+            raise CommandError('Нет поста для комментариев.')
+        user, _ = User.objects.get_or_create(username=LOADTEST_USERNAME)
+        addr = reverse('posts:add_comment', kwargs={'post_id': post.pk})
+        modes = list(MODES) if options['mode'] == 'both' else [
+            options['mode']
+        ]
+        self.stdout.write(f'{"режим":>13} {"принято/с":>10} '
+                          f'{"записано/с":>11} {"p50, мс":>9} '
+                          f'{"p99, мс":>9} {"ошибок":>7}')
+        try:
+            for mode in modes:
+                self.run_mode(mode, addr, user, options)
+        finally:
+            Comment.objects.filter(author=user).delete()
+
+    def run_mode(self, mode, addr, user, options):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        written_before = Comment.objects.filter(author=user).count()
+
+        def worker(number):
+            client = Client(SERVER_NAME='localhost')
+            client.force_login(user)
+            sent = 0
+            try:
+                while time.perf_counter() < deadline:
+                    sent += 1
+                    request_started = time.perf_counter()
+                    try:
+                        response = client.post(
+                            addr, {'text': f'Load {number}-{sent}'},
+                        )
+                        failed = response.status_code != 302
+                    except Exception:
+                        failed = True
+                    latency = time.perf_counter() - request_started
+                    with lock:
+                        latencies.append(latency * 1000)
+                        if failed:
+                            errors.append(latency)
+            finally:
+                connection.close()
+
+        with override_settings(COMMENT_WRITE_BEHIND=MODES[mode]):
+            started = time.perf_counter()
+            deadline = started + options['seconds']
+            threads = [threading.Thread(target=worker, args=(number,))
+                       for number in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            flush_comments()
+            elapsed = time.perf_counter() - started
+
+        if not latencies:
+            raise CommandError('Не выполнено ни одного запроса.')
+        written = (Comment.objects.filter(author=user).count()
+                   - written_before)
+        accepted = len(latencies) - len(errors)
+        self.stdout.write(
+            f'{mode:>13} {accepted / elapsed:10.1f} '
+            f'{written / elapsed:11.1f} '
+            f'{percentile(latencies, 0.5):9.2f} '
+            f'{percentile(latencies, 0.99):9.2f} '
+            f'{len(errors):7}'
+        )
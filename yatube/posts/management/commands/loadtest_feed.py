@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Нагружает страницу ленты в несколько потоков и печатает '
+            'задержки по секундам, в том числе на границах мягкого '
+            'срока кэша.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=int, default=10)
+        parser.add_argument('--soft-timeout', type=int, default=2)
+
+    def handle(self, *args, **options):
+        samples = []
+        lock = threading.Lock()
+        started = time.perf_counter()
+        deadline = started + options['seconds']
+
+        def worker():
+            client = Client(SERVER_NAME='localhost')
+            try:
+                while time.perf_counter() < deadline:
+                    request_started = time.perf_counter()
+                    response = client.get(options['path'])
+                    latency = time.perf_counter() - request_started
+                    with lock:
+                        samples.append((request_started - started,
+                                        latency,
+                                        response.status_code))
+            finally:
+                connection.close()
+
+        with override_settings(
+            FEED_CACHE_SOFT_TIMEOUT=options['soft_timeout'],
+        ):
+            threads = [threading.Thread(target=worker)
+                       for _ in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        if not samples:
+            raise CommandError('Не выполнено ни одного запроса.')
+        errors = sum(1 for *_, status in samples if status != 200)
+        by_second = defaultdict(list)
+        for offset, latency, _ in samples:
+            by_second[int(offset)].append(latency * 1000)
+        self.stdout.write(f'{"сек":>4} {"запросов":>9} {"p50, мс":>9} '
+                          f'{"p99, мс":>9} {"max, мс":>9}')
+        for second in sorted(by_second):
+            latencies = by_second[second]
+            self.stdout.write(
+                f'{second:4} {len(latencies):9} '
+                f'{percentile(latencies, 0.5):9.2f} '
+                f'{percentile(latencies, 0.99):9.2f} '
+                f'{max(latencies):9.2f}'
+            )
+        latencies = [latency * 1000 for _, latency, _ in samples]
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {len(samples)} запросов, ошибок {errors}, '
+            f'p50 {percentile(latencies, 0.5):.2f} мс, '
+            f'p99 {percentile(latencies, 0.99):.2f} мс'
+        ))
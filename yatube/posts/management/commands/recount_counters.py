@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import (recount_comment_counts,
+                            recount_media_references, recount_user_stats)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики постов, подписчиков, подписок '
+            'комментариев и ссылок на картинки по данным таблиц.')
+
+    def handle(self, *args, **options):
+        users = recount_user_stats()
+        posts = recount_comment_counts()
+        files = recount_media_references()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано пользователей: {users}, постов: {posts}, '
+            f'картинок: {files}'
+        ))
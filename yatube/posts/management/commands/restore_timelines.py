@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.timeline import restore_timelines
+
+
+class Command(BaseCommand):
+    help = ('Дорассылает недавние посты авторов, вернувшихся '
+            'от чтения ленты при запросе к рассылке.')
+
+    def handle(self, *args, **options):
+        authors = restore_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Возвращено к рассылке авторов: {authors}'
+        ))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.search import get_backend
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время поиска через индекс и через '
+            'LIKE %term% по тексту постов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='+')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        backends = {'like': self.like_search}
+        backend = get_backend()
+        backends[type(backend).__name__] = backend.search
+        for term in options['terms']:
+            for name, search in backends.items():
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    found = len(search(term))
+                elapsed = (time.perf_counter() - started) / options['repeat']
+                self.stdout.write(
+                    f'{term!r:20} {name:22} {found:6} найдено '
+                    f'{elapsed * 1000:8.2f} мс'
+                )
+
+    def like_search(self, term):
+        return list(
+            Post.objects.filter(
+                text__icontains=term,
+            ).values_list('id', flat=True)
+        )
@@ -0,0 +1,43 @@
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в реплики (DATABASES), '
+            'однократно или каждые --interval секунд: так локально '
+            'проверяется чтение лент с реплик и их отставание.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*',
+                            help='алиасы реплик, по умолчанию '
+                                 'DATABASE_REPLICAS или все, кроме default')
+        parser.add_argument('--interval', type=float)
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        aliases = (options['aliases'] or settings.DATABASE_REPLICAS
+                   or [alias for alias in connections.databases
+                       if alias != DEFAULT_DB_ALIAS])
+        for alias in aliases:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias}: реплика не SQLite.')
+        while True:
+            for alias in aliases:
+                self.copy(primary.settings_dict['NAME'],
+                          connections[alias].settings_dict['NAME'])
+                self.stdout.write(f'{alias}: скопирована')
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
+
+    def copy(self, source_name, target_name):
+        # Резервная копия SQLite -- согласованный снимок даже
+        # при идущей записи в основную базу.
+        with closing(sqlite3.connect(source_name)) as source, \
+                closing(sqlite3.connect(target_name)) as target:
+            source.backup(target)
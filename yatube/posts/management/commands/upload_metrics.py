@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts.images import get_upload_metrics
+
+
+class Command(BaseCommand):
+    help = 'Показывает, сколько места сэкономила нормализация картинок.'
+
+    def handle(self, *args, **options):
+        metrics = get_upload_metrics()
+        self.stdout.write(
+            'Загрузок: {uploads}, получено: {bytes_in}, '
+            'сохранено: {bytes_stored}, сэкономлено: {bytes_saved}'.format(
+                uploads=metrics['uploads'],
+                bytes_in=filesizeformat(metrics['bytes_in']),
+                bytes_stored=filesizeformat(metrics['bytes_stored']),
+                bytes_saved=filesizeformat(metrics['bytes_saved']),
+            )
+        )
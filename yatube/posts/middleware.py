@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .holes import HOLE_PATTERN, fill_holes
+from .routers import pin_to_primary, unpin
+
+
+# Cookie «недавно писал»: пока она жива, чтения идут
+# в основную базу.
+PRIMARY_COOKIE: str = 'read_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class HoleFillingMiddleware:
+    """Вставляет в HTML-ответ части, зависящие от пользователя.
+
+    Представления (и кэш лент) отдают общую для всех страницу
+    с маркерами дырок, а персональные шапка, кнопки и формы
+    дорисовываются здесь для каждого запроса, как ESI в прокси.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming
+                or 'text/html' not in response.get('Content-Type', '')):
+            return response
+        content = response.content.decode(response.charset)
+        if HOLE_PATTERN.search(content) is None:
+            return response
+        response.content = fill_holes(request, content)
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Закрепляет за основной базой запросы на запись и чтения
+    того же пользователя в течение REPLICA_STICKY_SECONDS после
+    записи (read-your-writes), пока реплики догоняют.
+
+    Записью считается и GET, который что-то записал в основную
+    базу (подписка по ссылке): метод запроса этого не говорит.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in SAFE_METHODS
+        token = pin_to_primary(writes or PRIMARY_COOKIE in request.COOKIES)
+        wrote = []
+
+        def track_writes(execute, sql, params, many, context):
+            if not wrote and sql.lstrip()[:7].upper().startswith(
+                    WRITE_STATEMENTS):
+                wrote.append(True)
+                # Дальше в этом же запросе читаем свою запись.
+                pin_to_primary()
+            return execute(sql, params, many, context)
+
+        try:
+            with connections[DEFAULT_DB_ALIAS].execute_wrapper(
+                    track_writes):
+                response = self.get_response(request)
+        finally:
+            unpin(token)
+        if (writes or wrote) and settings.DATABASE_REPLICAS:
+            response.set_cookie(PRIMARY_COOKIE, '1',
+                                max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True)
+        return response
@@ -0,0 +1,65 @@
+# Generated by Django 2.2.16 on 2026-10-17 18:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_fts_table(apps, schema_editor):
+    if not fts5_available(schema_editor):
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS posts_search USING fts5('
+        'body, post_id UNINDEXED, comment_id UNINDEXED)'
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_search (body, post_id, comment_id) '
+        'SELECT text, id, NULL FROM posts_post'
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_search (body, post_id, comment_id) '
+        'SELECT text, post_id, id FROM posts_comment'
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if fts5_available(schema_editor):
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('comment', models.ForeignKey(
+                    blank=True,
+                    null=True,
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='+',
+                    to='posts.Comment',
+                )),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'post'], name='search_term_post_idx'),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
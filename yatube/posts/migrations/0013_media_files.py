@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-17 18:49
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def fill_media_files(apps, schema_editor):
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    Post = apps.get_model('posts', 'Post')
+    totals = Post.objects.exclude(image='').exclude(
+        image__isnull=True,
+    ).order_by().values_list('image').annotate(total=Count('pk'))
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, references=total) for name, total in totals],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=posts.storage.ContentAddressedStorage(),
+                upload_to='posts/',
+                verbose_name='Картинка',
+            ),
+        ),
+        migrations.RunPython(fill_media_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 2.2.16 on 2026-10-17 19:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.crypto import get_random_string
+from django.utils.http import int_to_base36
+
+# Копия posts.models.make_path_segment на момент миграции:
+# миграция не должна меняться вместе с кодом модели.
+PATH_TIME_WIDTH = 10
+PATH_RANDOM_WIDTH = 4
+PATH_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def make_path_segment(created):
+    micros = round(created.timestamp() * 1000000)
+    inverted = len(PATH_ALPHABET) ** PATH_TIME_WIDTH - 1 - micros
+    return (int_to_base36(inverted).zfill(PATH_TIME_WIDTH)
+            + get_random_string(PATH_RANDOM_WIDTH, PATH_ALPHABET))
+
+
+def fill_comment_paths(apps, schema_editor):
+    # До этой миграции ответов не было: все комментарии корневые.
+    Comment = apps.get_model('posts', 'Comment')
+    comments = list(Comment.objects.only('created'))
+    for comment in comments:
+        comment.path = make_path_segment(comment.created)
+    Comment.objects.bulk_update(comments, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_post_created_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='replies',
+                to='posts.Comment',
+                verbose_name='Ответ на',
+            ),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=84),
+        ),
+        migrations.RunPython(fill_comment_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'depth', 'created'], name='comment_post_depth_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['parent', 'created'], name='comment_parent_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+    ]
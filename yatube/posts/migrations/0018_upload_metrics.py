@@ -0,0 +1,20 @@
+# Generated by Django 2.2.16 on 2026-10-17 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_comment_path_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadMetric',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def rekey_fts_rows(apps, schema_editor):
+    # rowid строки поиска выводится из ключа: пост -- id * 2,
+    # комментарий -- id * 2 + 1 (posts.search).
+    if not fts5_available(schema_editor):
+        return
+    schema_editor.execute('DELETE FROM posts_search')
+    schema_editor.execute(
+        'INSERT INTO posts_search (rowid, body, post_id, comment_id) '
+        'SELECT id * 2, text, id, NULL FROM posts_post'
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_search (rowid, body, post_id, comment_id) '
+        'SELECT id * 2 + 1, text, post_id, id FROM posts_comment'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_upload_metrics'),
+    ]
+
+    operations = [
+        migrations.RunPython(rekey_fts_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-17 19:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_pull_mode(apps, schema_editor):
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gt=settings.TIMELINE_PULL_FOLLOWER_THRESHOLD,
+    ).update(timeline_mode='pull')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_search_rowids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='timeline_mode',
+            field=models.CharField(
+                choices=[
+                    ('push', 'Рассылка'),
+                    ('pull', 'Чтение'),
+                    ('restore', 'Возврат к рассылке'),
+                ],
+                default='push',
+                max_length=7,
+            ),
+        ),
+        migrations.RunPython(set_pull_mode, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,28 @@
 # posts/models.py
-from django.db import models
+from django.db import DatabaseError, models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.http import int_to_base36
+
+from .storage import content_storage
 
 
 User = get_user_model()
 
+# Глубже этого уровня ответ прикрепляется к предку
+# (корневой комментарий -- уровень 0).
+MAX_COMMENT_DEPTH: int = 5
+# Сегмент пути комментария: перевернутое время создания
+# в base36 (новые раньше) и случайный хвост от совпадений.
+PATH_TIME_WIDTH: int = 10
+PATH_RANDOM_WIDTH: int = 4
+PATH_SEGMENT_WIDTH: int = PATH_TIME_WIDTH + PATH_RANDOM_WIDTH
+PATH_ALPHABET: str = '0123456789abcdefghijklmnopqrstuvwxyz'
+# Больше любого символа пути: path < prefix + PATH_END
+# для всех потомков prefix.
+PATH_END: str = '~'
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -15,7 +33,100 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class VersionConflict(DatabaseError):
+    """Строку изменили после того, как экземпляр был прочитан."""
+
+
+class VersionedModel(models.Model):
+    """Время последнего изменения и номер версии строки.
+
+    Версия растет при каждом save() и входит в ключи кэша
+    представлений объекта (posts.caching). Сохранение устаревшего
+    экземпляра поднимает VersionConflict.
+    """
+    updated_at = models.DateTimeField(
+        verbose_name='Изменено',
+        auto_now=True,
+        db_index=True,
+    )
+    version = models.PositiveIntegerField(
+        verbose_name='Версия',
+        default=1,
+        editable=False,
+    )
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {
+                *update_fields, 'updated_at', 'version',
+            }
+        self._loaded_version = self.version
+        self.version += 1
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            self.version = self._loaded_version
+            raise
+        finally:
+            del self._loaded_version
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields,
+                   forced_update):
+        # UPDATE ... WHERE version = прочитанная: из параллельных
+        # сохранений одного экземпляра проходит только первое.
+        loaded_version = getattr(self, '_loaded_version', None)
+        if loaded_version is None:
+            return super()._do_update(base_qs, using, pk_val, values,
+                                      update_fields, forced_update)
+        updated = super()._do_update(
+            base_qs.filter(version=loaded_version), using, pk_val,
+            values, update_fields, forced_update,
+        )
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            raise VersionConflict(
+                f'{self._meta.label} {pk_val}: версия '
+                f'{loaded_version} устарела.'
+            )
+        return updated
+
+
+class PostQuerySet(models.QuerySet):
+    FEED_FIELDS = (
+        'id',
+        'text',
+        'pub_date',
+        'version',
+        'image',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+    )
+    FEED_GROUP_FIELDS = (
+        'group__slug',
+        'group__title',
+    )
+
+    def for_feed(self, with_group=True):
+        """Посты для лент: автор (и группа) одним запросом,
+        только колонки, нужные карточке поста.
+        """
+        if not with_group:
+            return self.select_related('author').only(
+                'group', *self.FEED_FIELDS,
+            )
+        return self.select_related('author', 'group').only(
+            *self.FEED_FIELDS, *self.FEED_GROUP_FIELDS,
+        )
+
+
+class Post(VersionedModel):
     text = models.TextField(
         verbose_name='Текст',
         help_text='Введите текст поста'
@@ -43,18 +154,54 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True,
         null=True,
     )
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    # Счетчики меняются только запросами UPDATE ... = F() + n
+    # (posts.counters), обычное сохранение поста их не перезаписывает.
+    COUNTER_FIELDS = ('comment_count',)
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-pub_date']
+        # Индексы по возрастанию: SQLite дописывает в них rowid (id)
+        # и, читая их с конца, отдает порядок (-pub_date, -id)
+        # без сортировки.
+        indexes = [
+            models.Index(
+                fields=["group", "pub_date"],
+                name="post_group_pub_date_idx",
+            ),
+            models.Index(
+                fields=["author", "pub_date"],
+                name="post_author_pub_date_idx",
+            ),
+        ]
 
 
-class Comment(models.Model):
+class Comment(VersionedModel):
     post = models.ForeignKey(
         Post,
         verbose_name='Пост',
@@ -75,12 +222,76 @@ class Comment(models.Model):
         verbose_name='Дата',
         auto_now_add=True
     )
+    parent = models.ForeignKey(
+        'self',
+        verbose_name='Ответ на',
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name='replies',
+        db_index=False,
+    )
+    # Пути предков и свой сегмент: поддерево -- это диапазон
+    # path по индексу (post, path), а порядок path -- порядок
+    # вывода дерева.
+    path = models.CharField(
+        max_length=PATH_SEGMENT_WIDTH * (MAX_COMMENT_DEPTH + 1),
+        default='',
+        editable=False,
+    )
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.text[:15]
 
+    def build_path(self):
+        """Заполняет path и depth по родителю и времени создания.
+
+        Первичный ключ не нужен, поэтому путь можно построить
+        до bulk_create.
+        """
+        while (self.parent is not None
+               and self.parent.depth >= MAX_COMMENT_DEPTH):
+            self.parent = self.parent.parent
+        # created заполняется только при вставке; время пути
+        # расходится с ним на микросекунды.
+        segment = make_path_segment(self.created or timezone.now())
+        if self.parent is None:
+            self.path, self.depth = segment, 0
+        else:
+            self.path = self.parent.path + segment
+            self.depth = self.parent.depth + 1
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.path:
+            self.build_path()
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ["-created"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "path"],
+                name="unique_comment_path",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["post", "depth", "created"],
+                name="comment_post_depth_created_idx",
+            ),
+            models.Index(
+                fields=["parent", "created"],
+                name="comment_parent_created_idx",
+            ),
+        ]
+
+
+def make_path_segment(created):
+    micros = round(created.timestamp() * 1000000)
+    inverted = len(PATH_ALPHABET) ** PATH_TIME_WIDTH - 1 - micros
+    return (int_to_base36(inverted).zfill(PATH_TIME_WIDTH)
+            + get_random_string(PATH_RANDOM_WIDTH, PATH_ALPHABET))
 
 
 class Follow(models.Model):
@@ -106,3 +317,137 @@ class Follow(models.Model):
                 name="unique_follow",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["author", "user"],
+                name="follow_author_user_idx",
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Как посты автора попадают в ленты подписчиков (posts.timeline):
+    # рассылкой, чтением при запросе или чтением, пока рассылка
+    # недавних постов не догонит.
+    TIMELINE_PUSH = 'push'
+    TIMELINE_PULL = 'pull'
+    TIMELINE_RESTORE = 'restore'
+    TIMELINE_MODES = (
+        (TIMELINE_PUSH, 'Рассылка'),
+        (TIMELINE_PULL, 'Чтение'),
+        (TIMELINE_RESTORE, 'Возврат к рассылке'),
+    )
+    timeline_mode = models.CharField(
+        max_length=7,
+        choices=TIMELINE_MODES,
+        default=TIMELINE_PUSH,
+    )
+
+    def __str__(self) -> str:
+        return str(self.user)
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField()
+
+    def __str__(self) -> str:
+        view_str = '/'.join([str(self.user), str(self.post)])
+        return view_str
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                name="unique_timeline_entry",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="timeline_user_pub_date_idx",
+            ),
+            models.Index(
+                fields=["user", "author"],
+                name="timeline_user_author_idx",
+            ),
+        ]
+
+
+class SearchTerm(models.Model):
+    """Строка обратного индекса для баз без полнотекстового поиска."""
+    term = models.CharField(max_length=100)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    comment = models.ForeignKey(
+        Comment,
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    weight = models.PositiveIntegerField(default=1)
+
+    def __str__(self) -> str:
+        return self.term
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["term", "post"],
+                name="search_term_post_idx",
+            ),
+        ]
+
+
+class MediaFile(models.Model):
+    """Число постов, ссылающихся на файл картинки.
+
+    Файлы хранятся по хэшу содержимого и общие для одинаковых
+    загрузок, поэтому удалять файл можно только вместе
+    с последней ссылкой.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
+
+
+class UploadMetric(models.Model):
+    """Накопительный счетчик загрузок картинок (posts.images).
+
+    Хранится в базе: в кэше счетчик вытесняется и истекает.
+    """
+    name = models.CharField(max_length=32, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
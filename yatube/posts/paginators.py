@@ -0,0 +1,139 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+PAGE_WINDOW: int = 2
+NEXT: str = 'n'
+PREVIOUS: str = 'p'
+CURSOR_SEPARATOR: str = '|'
+
+
+def encode_cursor(direction, values):
+    first_value, second_value = values
+    raw = CURSOR_SEPARATOR.join(
+        [direction, first_value.isoformat(), str(second_value)]
+    )
+    token = base64.urlsafe_b64encode(raw.encode())
+    return token.decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Возвращает (направление, (дата, id)) или None,
+    если курсор пустой или поврежден.
+    """
+    if not cursor:
+        return None
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + padding).decode()
+        direction, first_value, second_value = raw.split(CURSOR_SEPARATOR)
+        first_value = parse_datetime(first_value)
+        second_value = int(second_value)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or first_value is None:
+        return None
+    return direction, (first_value, second_value)
+
+
+class WindowedPaginator(Paginator):
+    """Паджинатор, у страниц которого есть короткий диапазон
+    соседних номеров page_window вместо полного page_range.
+    """
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        first = max(page.number - PAGE_WINDOW, 1)
+        last = min(page.number + PAGE_WINDOW, self.num_pages)
+        page.page_window = range(first, last + 1)
+        return page
+
+
+class KeysetPaginator(WindowedPaginator):
+    """Паджинатор по ключу (дата, id) без COUNT(*) и OFFSET.
+
+    Страница выбирается условием «строго раньше/позже курсора»
+    по составному ключу, поэтому глубина страницы не влияет
+    на стоимость запроса. Доступ по номеру страницы
+    (get_page) сохранен для старых ссылок вида ?page=N.
+
+    count_key -- ключ кэша для общего числа объектов; должен
+    меняться при записи в ленту (см. posts.caching.get_count_key).
+    """
+    keys = ('pub_date', 'id')
+
+    def __init__(self, object_list, per_page, keys=None, count_key=None,
+                 **kwargs):
+        if keys is not None:
+            self.keys = keys
+        self.count_key = count_key
+        first, second = self.keys
+        object_list = object_list.order_by(f'-{first}', f'-{second}')
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return Paginator.count.func(self)
+        count = cache.get(self.count_key)
+        if count is None:
+            count = Paginator.count.func(self)
+            cache.set(self.count_key, count, settings.FEED_CACHE_TIMEOUT)
+        return count
+
+    def get_key(self, obj):
+        return tuple(getattr(obj, field) for field in self.keys)
+
+    def get_cursor_page(self, cursor=None):
+        position = decode_cursor(cursor)
+        if position is None:
+            rows = self._seek()
+            return self._build_page(rows[:self.per_page],
+                                    has_previous=False,
+                                    has_next=len(rows) > self.per_page)
+        direction, values = position
+        if direction == NEXT:
+            rows = self._seek(values)
+            return self._build_page(rows[:self.per_page],
+                                    has_previous=True,
+                                    has_next=len(rows) > self.per_page)
+        rows = self._seek(values, backwards=True)
+        if len(rows) <= self.per_page:
+            # Дошли до начала ленты: отдаем полную первую страницу.
+            return self.get_cursor_page()
+        return self._build_page(rows[:self.per_page][::-1],
+                                has_previous=True,
+                                has_next=True)
+
+    def _seek(self, values=None, backwards=False):
+        first, second = self.keys
+        lookup = 'gt' if backwards else 'lt'
+        queryset = self.object_list
+        if values is not None:
+            first_value, second_value = values
+            queryset = queryset.filter(
+                Q(**{f'{first}__{lookup}': first_value})
+                | Q(**{first: first_value,
+                       f'{second}__{lookup}': second_value})
+            )
+        if backwards:
+            queryset = queryset.order_by(first, second)
+        return list(queryset[:self.per_page + 1])
+
+    def _build_page(self, rows, has_previous, has_next):
+        page = Page(rows, None, self)
+        page.previous_cursor = None
+        page.next_cursor = None
+        if rows and has_previous:
+            page.previous_cursor = encode_cursor(PREVIOUS,
+                                                 self.get_key(rows[0]))
+        if rows and has_next:
+            page.next_cursor = encode_cursor(NEXT, self.get_key(rows[-1]))
+        return page
@@ -0,0 +1,79 @@
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Представление читает ленту и может читать с реплики.
+_replica_reads = ContextVar('replica_reads', default=False)
+# Пользователь недавно писал: чтения идут в основную базу,
+# чтобы он увидел свою запись, даже если реплика отстает.
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+def read_from_replica(view_func):
+    """Разрешает запросам представления на чтение идти
+    на реплики из DATABASE_REPLICAS.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return _wrapped_view
+
+
+def pin_to_primary(pinned=True):
+    """Закрепляет чтения текущего запроса за основной базой;
+    возвращает токен для unpin.
+    """
+    return _pinned_to_primary.set(pinned)
+
+
+def unpin(token):
+    _pinned_to_primary.reset(token)
+
+
+def is_pinned_to_primary():
+    return _pinned_to_primary.get()
+
+
+def get_replicas():
+    # Зеркало основной базы в тестах (TEST['MIRROR']) -- та же база,
+    # но через другое соединение, которое не видит транзакцию теста.
+    primary_name = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    return [
+        alias for alias in settings.DATABASE_REPLICAS
+        if connections[alias].settings_dict['NAME'] != primary_name
+    ]
+
+
+class ReplicaRouter:
+    """Запись -- в основную базу, чтение лент -- на случайную
+    реплику, если представление помечено read_from_replica,
+    а пользователь не закреплен за основной базой после записи
+    (см. ReplicaRoutingMiddleware).
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or _pinned_to_primary.get():
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики -- копии основной базы.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схему реплики получают вместе с данными (sync_replica).
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,208 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import Count, Sum
+
+from .models import Comment, Post, SearchTerm
+
+
+SEARCH_RESULTS_LIMIT: int = 1000
+TERM_MAX_LENGTH: int = 100
+POST_WEIGHT: int = 2
+COMMENT_WEIGHT: int = 1
+FTS_TABLE: str = 'posts_search'
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [
+        token[:TERM_MAX_LENGTH] for token in TOKEN_RE.findall(text.lower())
+    ]
+
+
+def fts5_available(schema_connection=connection):
+    if schema_connection.vendor != 'sqlite':
+        return False
+    with schema_connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def post_rowid(post_id):
+    return post_id * 2
+
+
+def comment_rowid(comment_id):
+    return comment_id * 2 + 1
+
+
+class Fts5Backend:
+    """Поиск через виртуальную таблицу SQLite FTS5 с ранжированием bm25.
+
+    Посты и комментарии лежат в одной таблице; совпадение в тексте
+    поста весит больше, чем в комментарии к нему.
+
+    rowid строки выводится из ключа (четные -- посты, нечетные --
+    комментарии): удаление по rowid не просматривает таблицу,
+    а колонки UNINDEXED индекса не имеют.
+    """
+
+    def index_post(self, post):
+        self.remove_post(post.pk)
+        self._insert(post_rowid(post.pk), post.text, post.pk, None)
+
+    def remove_post(self, post_id):
+        self._delete(post_rowid(post_id))
+
+    def index_comment(self, comment):
+        self.remove_comment(comment.pk)
+        self._insert(comment_rowid(comment.pk), comment.text,
+                     comment.post_id, comment.pk)
+
+    def index_comments(self, comments):
+        """Индексирует пачку новых комментариев одним запросом."""
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} '
+                '(rowid, body, post_id, comment_id) '
+                'VALUES (%s, %s, %s, %s)',
+                [(comment_rowid(comment.pk), comment.text,
+                  comment.post_id, comment.pk)
+                 for comment in comments],
+            )
+
+    def remove_comment(self, comment_id):
+        self._delete(comment_rowid(comment_id))
+
+    def search(self, query, limit=SEARCH_RESULTS_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        match = ' '.join('"{}"'.format(term) for term in terms)
+        with connection.cursor() as cursor:
+            # Скрытая колонка rank в FTS5 -- это bm25(): меньше -- лучше.
+            cursor.execute(
+                'SELECT post_id, MIN(rank * CASE '
+                'WHEN comment_id IS NULL THEN %s ELSE %s END) AS best '
+                'FROM {table} WHERE {table} MATCH %s '
+                'GROUP BY post_id ORDER BY best LIMIT %s'.format(
+                    table=FTS_TABLE,
+                ),
+                [POST_WEIGHT, COMMENT_WEIGHT, match, limit],
+            )
+            return [int(row[0]) for row in cursor.fetchall()]
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} '
+                '(rowid, body, post_id, comment_id) '
+                'SELECT id * 2, text, id, NULL FROM posts_post'
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} '
+                '(rowid, body, post_id, comment_id) '
+                'SELECT id * 2 + 1, text, post_id, id FROM posts_comment'
+            )
+
+    def _insert(self, rowid, text, post_id, comment_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} '
+                '(rowid, body, post_id, comment_id) '
+                'VALUES (%s, %s, %s, %s)',
+                [rowid, text, post_id, comment_id],
+            )
+
+    def _delete(self, rowid):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [rowid],
+            )
+
+
+class InvertedIndexBackend:
+    """Обратный индекс в таблице SearchTerm для остальных баз.
+
+    Найденный пост должен содержать все слова запроса (в тексте
+    или комментариях), ранг -- взвешенная частота слов.
+    """
+
+    def index_post(self, post):
+        self.remove_post(post.pk)
+        self._insert(post.text, post.pk, None, POST_WEIGHT)
+
+    def remove_post(self, post_id):
+        SearchTerm.objects.filter(
+            post_id=post_id,
+            comment__isnull=True,
+        ).delete()
+
+    def index_comment(self, comment):
+        self.remove_comment(comment.pk)
+        self._insert(comment.text, comment.post_id, comment.pk,
+                     COMMENT_WEIGHT)
+
+    def index_comments(self, comments):
+        """Индексирует пачку новых комментариев одним запросом."""
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term,
+                       post_id=comment.post_id,
+                       comment_id=comment.pk,
+                       weight=COMMENT_WEIGHT * count)
+            for comment in comments
+            for term, count in Counter(tokenize(comment.text)).items()
+        )
+
+    def remove_comment(self, comment_id):
+        SearchTerm.objects.filter(comment_id=comment_id).delete()
+
+    def search(self, query, limit=SEARCH_RESULTS_LIMIT):
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        return list(
+            SearchTerm.objects.filter(
+                term__in=terms,
+            ).values('post_id').annotate(
+                matched=Count('term', distinct=True),
+                score=Sum('weight'),
+            ).filter(
+                matched=len(terms),
+            ).order_by(
+                '-score', '-post_id',
+            ).values_list('post_id', flat=True)[:limit]
+        )
+
+    def rebuild(self):
+        SearchTerm.objects.all().delete()
+        for post in Post.objects.only('text').iterator():
+            self._insert(post.text, post.pk, None, POST_WEIGHT)
+        comments = Comment.objects.only('text', 'post_id').iterator()
+        for comment in comments:
+            self._insert(comment.text, comment.post_id, comment.pk,
+                         COMMENT_WEIGHT)
+
+    def _insert(self, text, post_id, comment_id, weight):
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term,
+                       post_id=post_id,
+                       comment_id=comment_id,
+                       weight=weight * count)
+            for term, count in Counter(tokenize(text)).items()
+        )
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    if fts5_available():
+        return Fts5Backend()
+    return InvertedIndexBackend()
+
+
+def search_post_ids(query, limit=SEARCH_RESULTS_LIMIT):
+    return get_backend().search(query, limit)
@@ -0,0 +1,221 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .caching import bump_generation, get_group_scopes, get_profile_scopes
+from .counters import (change_comment_count, change_media_references,
+                       change_user_stats)
+from .models import Comment, Follow, Group, MediaFile, Post, User
+from .search import get_backend
+from .storage import content_storage, delete_content
+from .thumbnails import schedule_thumbnails
+from .timeline import backfill_timeline, fan_out_post, trim_timeline
+
+
+def bump_on_commit(*scopes):
+    # Поколение меняется только после фиксации: иначе параллельный
+    # запрос нарисует страницу по старым данным под новым
+    # поколением и закэширует ее.
+    transaction.on_commit(lambda: bump_generation(*scopes))
+
+
+def get_image_name(image):
+    return getattr(image, 'name', image) or ''
+
+
+@receiver(post_init, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    # Пост могли перенести в другую группу: сбросить нужно обе ленты.
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+    instance._loaded_image = get_image_name(instance.__dict__.get('image'))
+
+
+def delete_unreferenced_image(image_name):
+    # DELETE держит блокировку строки счетчика до конца транзакции,
+    # и файл удаляется под ней: параллельная загрузка того же файла
+    # увеличит счетчик либо раньше (тогда строка не удалится), либо
+    # после удаления файла (и запишет его заново,
+    # см. count_image_references).
+    with transaction.atomic():
+        deleted, _ = MediaFile.objects.select_for_update().filter(
+            name=image_name, references=0,
+        ).delete()
+        if deleted and not Post.objects.filter(image=image_name).exists():
+            delete_content(image_name)
+
+
+def release_image(image_name):
+    change_media_references(image_name, -1)
+    # Файл удаляется только после фиксации: при откате пост
+    # снова на него ссылается.
+    transaction.on_commit(lambda: delete_unreferenced_image(image_name))
+
+
+@receiver(pre_save, sender=Post)
+def remember_image_upload(sender, instance, **kwargs):
+    # После записи в хранилище поле хранит только имя файла,
+    # а содержимое может понадобиться count_image_references.
+    image = instance.image
+    instance._image_upload = (
+        image if image and not image._committed else None
+    )
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, **kwargs):
+    # Должен идти раньше pregenerate_post_thumbnails:
+    # тот обновляет _loaded_image.
+    image_name = get_image_name(instance.image)
+    upload = getattr(instance, '_image_upload', None)
+    instance._image_upload = None
+    if image_name == instance._loaded_image:
+        return
+    if image_name:
+        change_media_references(image_name, 1)
+        if upload is not None:
+            # Хранилище не записывает существующий файл, а его
+            # последнюю ссылку могли снять до нашего счетчика.
+            content_storage.restore(image_name, upload.file)
+    if instance._loaded_image:
+        release_image(instance._loaded_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_post_image(sender, instance, **kwargs):
+    image_name = get_image_name(instance.image)
+    if image_name:
+        release_image(image_name)
+
+
+@receiver(post_save, sender=Post)
+def pregenerate_post_thumbnails(sender, instance, **kwargs):
+    image_name = get_image_name(instance.image)
+    if image_name and image_name != instance._loaded_image:
+        schedule_thumbnails(image_name)
+    instance._loaded_image = image_name
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, **kwargs):
+    if created:
+        change_user_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_user_stats(instance.author_id, create=False, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, **kwargs):
+    if created:
+        change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def index_post_text(sender, instance, **kwargs):
+    get_backend().index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post_text(sender, instance, **kwargs):
+    get_backend().remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment_text(sender, instance, **kwargs):
+    get_backend().index_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment_text(sender, instance, **kwargs):
+    get_backend().remove_comment(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        fan_out_post(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    bump_on_commit(
+        'index',
+        *get_profile_scopes(instance.author_id),
+        *get_group_scopes(instance.group_id, instance._loaded_group_id),
+    )
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_page(sender, instance, created, **kwargs):
+    # Карточка поста в лентах сменит ключ по версии, а страницу
+    # поста кэш находит по поколению.
+    if not created:
+        bump_on_commit(f'post:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post_comments(sender, instance, **kwargs):
+    bump_on_commit(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_cards(sender, instance, created, update_fields,
+                            **kwargs):
+    if created or update_fields == frozenset(['last_login']):
+        return
+    group_ids = Group.objects.filter(
+        posts__author=instance,
+    ).distinct().values_list('id', flat=True)
+    bump_on_commit(
+        f'author:{instance.pk}',
+        'index',
+        *get_profile_scopes(instance.pk),
+        *get_group_scopes(*group_ids),
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, **kwargs):
+    bump_on_commit('index', f'group:{instance.slug}')
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(sender, instance, created, **kwargs):
+    if created:
+        change_user_stats(instance.author_id, followers_count=1)
+        change_user_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change_user_stats(instance.author_id, create=False, followers_count=-1)
+    change_user_stats(instance.user_id, create=False, following_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_follower_timeline(sender, instance, created, **kwargs):
+    if created:
+        backfill_timeline(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_follower_timeline(sender, instance, **kwargs):
+    trim_timeline(instance)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_profile(sender, instance, **kwargs):
+    bump_on_commit(*get_profile_scopes(instance.author_id))
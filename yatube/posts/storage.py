@@ -0,0 +1,63 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла -- хэш его содержимого.
+
+    Одинаковые загрузки попадают в один файл (и делят один набор
+    миниатюр sorl-thumbnail), а повторная запись пропускается.
+    Папка из upload_to и расширение исходного имени сохраняются:
+    posts/test.gif -> posts/3f/3fa4...e1.gif.
+    """
+    hash_algorithm = 'sha256'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+    def restore(self, name, content):
+        """Записывает файл заново, если его удалили после save()."""
+        if self.exists(name):
+            return
+        saved_name = self._save(name, content)
+        if saved_name != name:
+            # Файл успели записать параллельно: копия не нужна.
+            self.delete(saved_name)
+
+    def get_content_name(self, name, content):
+        digest = self.get_digest(content)
+        dir_name, file_name = os.path.split(name)
+        extension = os.path.splitext(file_name)[1].lower()
+        return os.path.join(dir_name, digest[:2], digest + extension)
+
+    def get_digest(self, content):
+        hasher = hashlib.new(self.hash_algorithm)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return hasher.hexdigest()
+
+
+def delete_content(name, storage=None):
+    """Удаляет файл вместе с его миниатюрами и записями sorl."""
+    delete(ImageFile(name, storage or content_storage))
+
+
+content_storage = ContentAddressedStorage()
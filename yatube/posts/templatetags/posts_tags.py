@@ -0,0 +1,81 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from ..caching import get_post_card_key
+from ..holes import hole_marker
+from ..thumbnails import (DEFAULT_WIDTH, FALLBACK_FORMAT, RESPONSIVE_WIDTHS,
+                          get_derivative_options, get_geometry,
+                          get_modern_formats, get_responsive_widths)
+
+
+register = template.Library()
+
+IMAGE_SIZES: str = '(max-width: 960px) 100vw, 960px'
+
+
+@register.simple_tag
+def post_card(post):
+    """Карточка поста для лент, общая для всех страниц и пользователей."""
+    key = get_post_card_key(post)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('posts/includes/post_in_list.html',
+                                {'post': post})
+        cache.set(key, html, settings.FEED_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+@register.simple_tag
+def hole(name, **params):
+    """Маркер части страницы, которая зависит от пользователя
+    и дорисовывается после кэша (posts.middleware).
+    """
+    return hole_marker(name, **params)
+
+
+@register.inclusion_tag('posts/includes/responsive_image.html')
+def responsive_image(image, css_class='card-img my-2'):
+    """Картинка поста с производными разной ширины и формата.
+
+    Пока производные не готовы, отдается оригинал без srcset.
+    """
+    if not image:
+        return {}
+    # Размер оригинала известен из хранилища sorl после генерации
+    # производных; до нее первая же миниатюра вернет оригинал.
+    source = default.kvstore.get(ImageFile(image))
+    if source is None:
+        widths = RESPONSIVE_WIDTHS[:1]
+    else:
+        widths = get_responsive_widths(source.width)
+    if not widths:
+        return {'src': image.url, 'css_class': css_class}
+    formats = [*get_modern_formats(), (FALLBACK_FORMAT, 'image/jpeg')]
+    sources = []
+    for image_format, mime_type in formats:
+        srcset = []
+        for width in widths:
+            thumbnail = default.backend.get_thumbnail(
+                image,
+                get_geometry(width),
+                **get_derivative_options(image_format),
+            )
+            if thumbnail.name == image.name:
+                return {'src': thumbnail.url, 'css_class': css_class}
+            if width <= DEFAULT_WIDTH:
+                src = thumbnail.url
+            srcset.append(f'{thumbnail.url} {width}w')
+        sources.append({'type': mime_type, 'srcset': ', '.join(srcset)})
+    fallback = sources.pop()
+    return {
+        'sources': sources,
+        'src': src,
+        'srcset': fallback['srcset'],
+        'sizes': IMAGE_SIZES,
+        'css_class': css_class,
+    }
@@ -0,0 +1,95 @@
+import pickle
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+from ..cache_backends import TwoTierCache
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = TwoTierCache('shared', {
+            'OPTIONS': {
+                'MAX_ENTRIES': 10,
+                'LOCAL_TIMEOUT': 60,
+                'LOCAL_BYPASS_PREFIXES': ('feed_generation:',),
+            },
+        })
+        self.shared = caches['shared']
+        self.cache.clear()
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def test_local_tier_serves_hits(self):
+        """Прочитанное значение отдается из памяти процесса."""
+        self.cache.set('page', 'cached')
+        self.shared.delete('page')
+        self.assertEqual(self.cache.get('page'), 'cached')
+
+    def test_shared_value_reaches_local_tier(self):
+        """Значение, записанное другим процессом, читается из общего
+        кэша и запоминается локально.
+        """
+        self.shared.set('page', 'from other worker')
+        self.assertEqual(self.cache.get('page'), 'from other worker')
+        self.shared.delete('page')
+        self.assertEqual(self.cache.get_many(['page']),
+                         {'page': 'from other worker'})
+
+    def test_generation_keys_bypass_local_tier(self):
+        """Поколения всегда читаются из общего кэша."""
+        key = 'feed_generation:index'
+        self.cache.set(key, 1)
+        self.shared.set(key, 2)
+        self.assertEqual(self.cache.get(key), 2)
+        self.assertEqual(self.cache.get_many([key]), {key: 2})
+
+    def test_values_are_copied(self):
+        """Изменение полученного объекта не меняет кэш."""
+        self.cache.set('items', [1, 2])
+        self.cache.get('items').append(3)
+        self.assertEqual(self.cache.get('items'), [1, 2])
+
+    def test_incr_drops_local_copy(self):
+        """После incr читается новое значение."""
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.get('counter'), 1)
+        self.cache.incr('counter')
+        self.assertEqual(self.cache.get('counter'), 2)
+
+    def test_local_tier_is_bounded(self):
+        """LRU не растет больше MAX_ENTRIES."""
+        for number in range(20):
+            self.cache.set(f'key:{number}', number)
+        self.assertEqual(len(self.cache.local), 10)
+
+
+class SharedFileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['shared']
+        self.cache.delete('lock')
+
+    def tearDown(self):
+        self.cache.delete('lock')
+
+    def test_add_only_once(self):
+        """add удается только первому, пока ключ жив."""
+        self.assertTrue(self.cache.add('lock', 1, 10))
+        self.assertFalse(self.cache.add('lock', 2, 10))
+        self.assertEqual(self.cache.get('lock'), 1)
+
+    def test_incr_keeps_timeout(self):
+        """incr не меняет срок жизни ключа."""
+        self.cache.set('lock', 1, None)
+        self.assertEqual(self.cache.incr('lock', 2), 3)
+        with open(self.cache._key_to_file('lock'), 'rb') as f:
+            self.assertIsNone(pickle.load(f))
+        self.cache.set('lock', 1, -1)
+        with self.assertRaises(ValueError):
+            self.cache.incr('lock')
+
+    def test_add_replaces_expired_key(self):
+        """Просроченный ключ можно добавить заново."""
+        self.cache.set('lock', 1, -1)
+        self.assertTrue(self.cache.add('lock', 2, 10))
+        self.assertEqual(self.cache.get('lock'), 2)
@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from ..comment_queue import flush_comments
+from ..models import Comment, Post
+from ..search import search_post_ids
+
+User = get_user_model()
+
+
+@override_settings(COMMENT_WRITE_BEHIND=True, COMMENT_BATCH_SIZE=3,
+                   COMMENT_BATCH_DELAY=60, COMMENT_QUEUE_LIMIT=5)
+class CommentQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Robot')
+        cls.post = Post.objects.create(author=cls.user, text='Test post')
+        cls.comment = Comment.objects.create(post=cls.post, author=cls.user,
+                                             text='Root')
+
+    def setUp(self):
+        self.client.force_login(CommentQueueTests.user)
+        cache.clear()
+
+    def tearDown(self):
+        flush_comments()
+
+    def add_comment(self, text, post_id=None, **data):
+        return self.client.post(
+            reverse('posts:add_comment',
+                    kwargs={'post_id': post_id or self.post.id}),
+            {'text': text, **data},
+        )
+
+    def test_comments_written_in_batches(self):
+        """Комментарии ждут в очереди и пишутся пачкой, когда
+        она заполнится, с теми же счетчиками, поиском и кэшем,
+        что и при синхронной записи.
+        """
+        addr = reverse('posts:post_detail',
+                       kwargs={'post_id': self.post.id})
+        self.client.get(addr)
+        self.add_comment('Queued one', parent=self.comment.id)
+        self.add_comment('Queued two')
+        self.assertEqual(Comment.objects.count(), 1)
+        self.add_comment('Queued three')
+        self.assertEqual(Comment.objects.count(), 4)
+        self.assertEqual(Comment.objects.get(text='Queued one').parent,
+                         self.comment)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 4)
+        self.assertEqual(search_post_ids('three'), [self.post.id])
+        self.assertContains(self.client.get(addr), 'Queued three')
+
+    def test_flush_drops_deleted_posts_and_foreign_parents(self):
+        """Комментарий к удаленному посту отбрасывается, а ответ
+        на комментарий другого поста становится корневым.
+        """
+        other_post = Post.objects.create(author=self.user, text='Other')
+        elsewhere = Comment.objects.create(
+            post=Post.objects.create(author=self.user, text='Third'),
+            author=self.user,
+            text='Elsewhere',
+        )
+        self.add_comment('Lost', post_id=other_post.id)
+        self.add_comment('Foreign', parent=elsewhere.id)
+        other_post.delete()
+        with self.assertLogs('posts.comment_queue', 'WARNING'):
+            self.assertEqual(flush_comments(), 2)
+        self.assertFalse(Comment.objects.filter(text='Lost').exists())
+        foreign = Comment.objects.get(text='Foreign')
+        self.assertIsNone(foreign.parent)
+        self.assertEqual(foreign.depth, 0)
+
+    def test_full_queue_falls_back_to_synchronous_write(self):
+        """Когда очередь полна, комментарий пишется сразу."""
+        with override_settings(COMMENT_BATCH_SIZE=10, COMMENT_QUEUE_LIMIT=1):
+            self.add_comment('Queued')
+            self.add_comment('Direct')
+            self.assertFalse(Comment.objects.filter(text='Queued').exists())
+            self.assertTrue(Comment.objects.filter(text='Direct').exists())
+        self.assertEqual(flush_comments(), 1)
+        self.assertTrue(Comment.objects.filter(text='Queued').exists())
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase
+from ..db.sqlite3.base import DatabaseWrapper
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        settings_dict = {
+            **connection.settings_dict,
+            'NAME': os.path.join(self.temp_dir, 'db.sqlite3'),
+            'OPTIONS': {'pragmas': {'cache_size': -1024}},
+        }
+        self.wrapper = DatabaseWrapper(settings_dict, alias='tuned')
+
+    def tearDown(self):
+        self.wrapper.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def pragma(self, name):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connection_gets_pragmas(self):
+        """Новое соединение в WAL, с PRAGMA по умолчанию
+        и переопределенными в OPTIONS.
+        """
+        expected = {
+            'journal_mode': 'wal',
+            'synchronous': 1,
+            'busy_timeout': 5000,
+            'temp_store': 2,
+            'cache_size': -1024,
+        }
+        for name, value in expected.items():
+            with self.subTest(pragma=name):
+                self.assertEqual(self.pragma(name), value)
+
+    def test_transactions_take_write_lock_at_start(self):
+        """atomic сразу берет блокировку записи (BEGIN IMMEDIATE)."""
+        self.wrapper.ensure_connection()
+        self.wrapper._start_transaction_under_autocommit()
+        try:
+            self.assertTrue(self.wrapper.connection.in_transaction)
+            other = DatabaseWrapper(
+                {**self.wrapper.settings_dict,
+                 'OPTIONS': {'pragmas': {'busy_timeout': 0}}},
+                alias='other',
+            )
+            with self.assertRaisesMessage(OperationalError, 'locked'):
+                other.cursor().execute('BEGIN IMMEDIATE')
+            other.close()
+        finally:
+            self.wrapper.connection.rollback()
@@ -4,7 +4,12 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.urls.base import reverse
 from django.core.cache import cache
+from django.template.defaultfilters import filesizeformat
+from ..images import get_upload_metrics, record_upload
 from ..models import Post, Group
+from io import BytesIO
+from unittest.mock import patch
+from PIL import Image
 import shutil
 import tempfile
 from django.conf import settings
@@ -95,7 +100,9 @@ class PostFormTests(TestCase):
         post = Post.objects.latest("id")
         self.assertEqual(post.text, PostFormTests.post_with_group.text)
         self.assertEqual(post.group, PostFormTests.post_with_group.group)
-        self.assertEqual(post.image, f'posts/{file_name}')
+        self.assertRegex(
+            post.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.gif$'
+        )
 
     def test_create_post_without_group(self):
         """Валидная форма создает запись в Post без указания группы"""
@@ -131,3 +138,99 @@ class PostFormTests(TestCase):
         )
         edit_post = Post.objects.get(id=PostFormTests.post_with_group.id)
         self.assertEqual(edit_post.text, form_data["text"])
+
+    def test_edit_post_conflict(self):
+        """Правка поста, сохраненного после ее открытия, не затирает
+        его и возвращает форму с ошибкой.
+        """
+        stale = Post.objects.get(id=PostFormTests.post_with_group.id)
+        Post.objects.get(id=stale.id).save()
+        with patch('posts.views.get_object_or_404', return_value=stale):
+            response = self.authorized_client.post(
+                PostFormTests.url_edit,
+                data={"text": "Stale text"},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].non_field_errors())
+        self.assertEqual(Post.objects.get(id=stale.id).text, 'Test post')
+
+    @staticmethod
+    def get_image_with_exif(size, image_format='JPEG', name='photo.jpg'):
+        """Готовим картинку с EXIF-метаданными."""
+        exif = Image.Exif()
+        exif[0x010F] = 'RobotCamera'
+        buffer = BytesIO()
+        Image.new('RGB', size, color=(200, 30, 30)).save(
+            buffer, image_format, exif=exif.tobytes()
+        )
+        return SimpleUploadedFile(
+            name=name,
+            content=buffer.getvalue(),
+            content_type=Image.MIME[image_format],
+        )
+
+    @override_settings(POST_IMAGE_MAX_EDGE=100)
+    def test_create_post_normalizes_image(self):
+        """Картинка уменьшается до предельной стороны,
+        EXIF удаляется, имя файла сохраняется.
+        """
+        bytes_saved = get_upload_metrics()['bytes_saved']
+        self.authorized_client.post(
+            PostFormTests.url_create,
+            data={
+                'text': 'Post with photo',
+                'image': self.get_image_with_exif((400, 200)),
+            },
+        )
+        post = Post.objects.latest('id')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (100, 50))
+            self.assertNotIn('exif', stored.info)
+        self.assertGreater(get_upload_metrics()['bytes_saved'], bytes_saved)
+
+    def test_upload_metrics_survive_cache_clear(self):
+        """Счетчики загрузок хранятся в базе, а не в кэше."""
+        record_upload(300, 100)
+        record_upload(200, 200)
+        cache.clear()
+        metrics = get_upload_metrics()
+        self.assertEqual(metrics['uploads'], 2)
+        self.assertEqual(metrics['bytes_saved'], 200)
+
+    def test_create_post_strips_png_metadata(self):
+        """EXIF удаляется и из PNG, даже если картинка
+        не уменьшается.
+        """
+        self.authorized_client.post(
+            PostFormTests.url_create,
+            data={
+                'text': 'Post with png',
+                'image': self.get_image_with_exif(
+                    (40, 20), 'PNG', 'photo.png'
+                ),
+            },
+        )
+        post = Post.objects.latest('id')
+        self.assertTrue(post.image.name.endswith('.png'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (40, 20))
+            self.assertNotIn('exif', stored.info)
+            self.assertNotIn(0x010F, stored.getexif())
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_create_post_rejects_large_image(self):
+        """Слишком большой файл не проходит валидацию формы."""
+        posts_count = Post.objects.count()
+        response = self.authorized_client.post(
+            PostFormTests.url_create,
+            data={
+                'text': 'Post with photo',
+                'image': self.get_image_with_exif((400, 200)),
+            },
+        )
+        self.assertFormError(
+            response, 'form', 'image',
+            f'Файл больше {filesizeformat(100)}.'
+        )
+        self.assertEqual(Post.objects.count(), posts_count)
@@ -1,6 +1,14 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_save
 from django.test import TestCase
-from ..models import Group, Post
+from django.test.utils import CaptureQueriesContext
+from ..models import (MAX_COMMENT_DEPTH, PATH_SEGMENT_WIDTH, Comment, Follow,
+                      Group, Post, UserStats, VersionConflict)
+from ..threads import REPLIES_PER_LEVEL, get_descendants
 
 
 User = get_user_model()
@@ -67,3 +75,192 @@ class PostModelTests(TestCase):
                     post._meta.get_field(field).help_text,
                     expected_text
                 )
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        """Счетчики меняются вместе с постами, комментариями
+        и подписками.
+        """
+        post = Post.objects.create(author=self.author, text='Test post')
+        Comment.objects.create(post=post, author=self.reader, text='Hi')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.author.stats.posts_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 1)
+        self.assertEqual(self.reader.stats.following_count, 1)
+        follow.delete()
+        post.comments.all().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.followers_count, 0)
+        post.delete()
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.posts_count, 0)
+
+    def test_edit_keeps_comment_count(self):
+        """Сохранение устаревшего экземпляра поста не затирает
+        счетчик комментариев.
+        """
+        post = Post.objects.create(author=self.author, text='Test post')
+        Comment.objects.create(post=post, author=self.reader, text='Hi')
+        Comment.objects.create(post=post, author=self.reader, text='Yo')
+        post.text = 'Edited post'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Edited post')
+        self.assertEqual(post.comment_count, 2)
+
+    def test_recount_counters_repairs_stats(self):
+        """Команда recount_counters восстанавливает счетчики."""
+        post = Post.objects.create(author=self.author, text='Test post')
+        Comment.objects.create(post=post, author=self.reader, text='Hi')
+        UserStats.objects.all().delete()
+        Post.objects.update(comment_count=0)
+        call_command('recount_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1
+        )
+
+
+class VersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+
+    def test_version_and_updated_at_follow_saves(self):
+        """Каждое сохранение поста и комментария увеличивает версию
+        и время изменения, в том числе с update_fields.
+        """
+        post = Post.objects.create(author=self.author, text='Test post')
+        comment = Comment.objects.create(post=post, author=self.author,
+                                         text='Hi')
+        for obj, field in ((post, 'text'), (comment, 'text')):
+            with self.subTest(model=type(obj).__name__):
+                self.assertEqual(obj.version, 1)
+                updated_at = obj.updated_at
+                setattr(obj, field, 'Edited')
+                obj.save(update_fields=[field])
+                self.assertEqual(obj.version, 2)
+                obj.refresh_from_db()
+                self.assertEqual(obj.version, 2)
+                self.assertGreater(obj.updated_at, updated_at)
+
+    def test_stale_save_conflicts(self):
+        """Сохранение экземпляра, прочитанного до чужого сохранения,
+        не затирает его и поднимает VersionConflict.
+        """
+        post = Post.objects.create(author=self.author, text='Test post')
+        stale = Post.objects.get(pk=post.pk)
+        post.save()
+        stale.text = 'Stale edit'
+        with self.assertRaises(VersionConflict), transaction.atomic():
+            stale.save()
+        self.assertEqual(stale.version, 1)
+        post.refresh_from_db()
+        self.assertEqual((post.text, post.version), ('Test post', 2))
+
+    def test_save_does_not_reread_version(self):
+        """Новая версия известна без повторного чтения строки,
+        обработчики post_save видят число.
+        """
+        post = Post.objects.create(author=self.author, text='Test post')
+        versions = []
+
+        def remember_version(sender, instance, **kwargs):
+            versions.append(instance.version)
+
+        post_save.connect(remember_version, sender=Post)
+        self.addCleanup(post_save.disconnect, remember_version, sender=Post)
+        with CaptureQueriesContext(connection) as queries:
+            post.save(update_fields=['text'])
+        self.assertEqual(versions, [2])
+        reread = 'SELECT "posts_post"."id", "posts_post"."version"'
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith(reread)])
+
+
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Test post')
+
+    def reply(self, parent, text='Reply'):
+        return Comment.objects.create(post=self.post, author=self.author,
+                                      parent=parent, text=text)
+
+    def test_path_nests_and_depth_is_limited(self):
+        """Путь ответа продолжает путь родителя, а ответы глубже
+        MAX_COMMENT_DEPTH прикрепляются к предку.
+        """
+        comment = self.reply(None, 'Root')
+        self.assertEqual(comment.depth, 0)
+        self.assertEqual(len(comment.path), PATH_SEGMENT_WIDTH)
+        for depth in range(1, MAX_COMMENT_DEPTH + 1):
+            parent, comment = comment, self.reply(comment)
+            self.assertEqual(comment.depth, depth)
+            self.assertTrue(comment.path.startswith(parent.path))
+        deepest = comment
+        comment = self.reply(deepest)
+        self.assertEqual(comment.depth, MAX_COMMENT_DEPTH)
+        self.assertEqual(comment.parent, deepest.parent)
+
+    def test_path_order_is_newest_first(self):
+        """Порядок path -- новые комментарии раньше старых,
+        поддерево сразу за корнем.
+        """
+        old = self.reply(None, 'Old')
+        new = self.reply(None, 'New')
+        old_reply = self.reply(old)
+        self.assertEqual(
+            list(Comment.objects.order_by('path')),
+            [new, old, old_reply],
+        )
+
+    def test_path_built_without_pk(self):
+        """Путь строится до сохранения, поэтому годится
+        для bulk_create.
+        """
+        root = self.reply(None, 'Root')
+        comment = Comment(post=self.post, author=self.author,
+                          parent=root, text='Bulk')
+        comment.build_path()
+        Comment.objects.bulk_create([comment])
+        self.assertEqual(
+            Comment.objects.get(text='Bulk').path[:PATH_SEGMENT_WIDTH],
+            root.path,
+        )
+
+    def test_path_unique_within_post(self):
+        """Путь комментария уникален в пределах поста: по нему
+        очередь находит строки после bulk_create.
+        """
+        root = self.reply(None, 'Root')
+        with self.assertRaises(IntegrityError):
+            Comment.objects.create(post=self.post, author=self.author,
+                                   path=root.path, text='Duplicate')
+
+    def test_descendants_limited_to_rendered_replies(self):
+        """Из потомков читаются только показываемые ответы и один
+        лишний на уровень, поддеревья скрытых ответов не читаются.
+        """
+        root = self.reply(None, 'Root')
+        replies = [self.reply(root) for _ in range(REPLIES_PER_LEVEL + 2)]
+        hidden_child = self.reply(replies[0])
+        shown_child = self.reply(replies[-1])
+        descendants = get_descendants(self.post, [root])
+        self.assertEqual(
+            descendants,
+            sorted([*replies[1:], shown_child], key=lambda c: c.path),
+        )
+        self.assertNotIn(hidden_child, descendants)
@@ -0,0 +1,100 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Полный просмотр таблицы без индекса: "SCAN posts_post" без USING.
+FULL_SCAN = re.compile(r'^SCAN (?!subquery\b)\S+$')
+# Ранжирование полнотекстового поиска по релевантности индексом
+# не упорядочить.
+ALLOWED_SORT_TABLES = ('posts_search',)
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Создаем ленты всех видов: группа, автор, подписка,
+        комментарии.
+        """
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Testing group',
+            slug='test-slug',
+            description='Testing description',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=cls.author,
+                group=cls.group,
+                text=f'Testing post {i}',
+            )
+            cls.comment = Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'Comment {i}',
+            )
+            Comment.objects.create(post=cls.post, author=cls.author,
+                                   parent=cls.comment, text=f'Reply {i}')
+
+    def setUp(self):
+        self.client.force_login(QueryPlanTests.reader)
+        cache.clear()
+
+    def get_plans(self, addr):
+        """Планы (EXPLAIN QUERY PLAN) всех SELECT, выполненных
+        при запросе страницы.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(addr)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def test_view_queries_use_indexes(self):
+        """Каждый запрос страниц ищет по индексу и получает
+        порядок из индекса, без полного просмотра и сортировки.
+        """
+        author = QueryPlanTests.author.username
+        slug = QueryPlanTests.group.slug
+        addrs = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': slug}),
+            reverse('posts:profile', kwargs={'username': author}),
+            reverse('posts:post_detail',
+                    kwargs={'post_id': QueryPlanTests.post.id}),
+            reverse('posts:post_comments',
+                    kwargs={'post_id': QueryPlanTests.post.id}),
+            reverse('posts:post_comments',
+                    kwargs={'post_id': QueryPlanTests.post.id})
+            + f'?parent={QueryPlanTests.comment.id}',
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=Testing',
+            reverse('posts:profile_follow', kwargs={'username': author}),
+            reverse('posts:profile_unfollow', kwargs={'username': author}),
+        ]
+        paged = addrs[:3] + [addrs[6]]
+        addrs += [f'{addr}?page=2' for addr in paged]
+        for addr in addrs:
+            for sql, plan in self.get_plans(addr):
+                with self.subTest(address=addr, sql=sql):
+                    for step in plan:
+                        self.assertIsNone(FULL_SCAN.match(step), plan)
+                        if 'TEMP B-TREE' in step:
+                            self.assertTrue(
+                                any(f'FROM {table} ' in sql
+                                    for table in ALLOWED_SORT_TABLES),
+                                plan,
+                            )
@@ -0,0 +1,105 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from ..middleware import PRIMARY_COOKIE, ReplicaRoutingMiddleware
+from ..models import Post
+from ..routers import (ReplicaRouter, is_pinned_to_primary, pin_to_primary,
+                       read_from_replica, unpin)
+
+User = get_user_model()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        # В тестах реплика -- зеркало основной базы; делаем вид,
+        # что это отдельный файл.
+        self.replica_file = patch.dict(connections['replica'].settings_dict,
+                                       NAME='replica.sqlite3')
+
+    def read_alias(self, request=None):
+        return self.router.db_for_read(Post)
+
+    def test_feed_reads_go_to_replica(self):
+        """Чтения представлений лент идут на реплику, остальное --
+        в основную базу.
+        """
+        with self.replica_file:
+            self.assertEqual(read_from_replica(self.read_alias)(None),
+                             'replica')
+            self.assertEqual(self.read_alias(), DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_write(Post),
+                             DEFAULT_DB_ALIAS)
+
+    def test_pinned_and_mirror_reads_go_to_primary(self):
+        """После записи и для зеркала основной базы чтения идут
+        в основную базу.
+        """
+        token = pin_to_primary()
+        try:
+            with self.replica_file:
+                self.assertEqual(read_from_replica(self.read_alias)(None),
+                                 DEFAULT_DB_ALIAS)
+        finally:
+            unpin(token)
+        self.assertEqual(read_from_replica(self.read_alias)(None),
+                         DEFAULT_DB_ALIAS)
+
+    def test_middleware_pins_writes_and_following_reads(self):
+        """Запрос на запись ставит cookie, и пока она жива,
+        запросы пользователя закреплены за основной базой.
+        """
+        pinned = []
+
+        def get_response(request):
+            pinned.append(is_pinned_to_primary())
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        factory = RequestFactory()
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]['max-age'], 10)
+        middleware(factory.get('/'))
+        request = factory.get('/')
+        request.COOKIES[PRIMARY_COOKIE] = '1'
+        middleware(request)
+        self.assertEqual(pinned, [True, False, True])
+        self.assertFalse(is_pinned_to_primary())
+
+    def test_get_that_writes_pins_following_reads(self):
+        """GET, который пишет в базу (подписка по ссылке),
+        тоже ставит cookie.
+        """
+        author = User.objects.create_user(username='Robot')
+        reader = User.objects.create_user(username='Reader')
+        self.client.force_login(reader)
+        response = self.client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': author.username})
+        )
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        del self.client.cookies[PRIMARY_COOKIE]
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_pinned_user_bypasses_cached_page(self):
+        """После записи пользователь получает страницу ленты
+        из основной базы, а не копию из кэша.
+        """
+        cache.clear()
+        author = User.objects.create_user(username='Robot')
+        addr = reverse('posts:index')
+        self.client.get(addr)
+        # bulk_create не шлет сигналов: поколение ленты не меняется.
+        Post.objects.bulk_create([Post(author=author, text='Fresh post')])
+        self.assertNotContains(self.client.get(addr), 'Fresh post')
+        self.client.cookies[PRIMARY_COOKIE] = '1'
+        self.assertContains(self.client.get(addr), 'Fresh post')
+        del self.client.cookies[PRIMARY_COOKIE]
+        self.assertContains(self.client.get(addr), 'Fresh post')
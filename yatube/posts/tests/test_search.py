@@ -0,0 +1,114 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.core.cache import cache
+from ..models import Post, Comment
+from ..search import (Fts5Backend, InvertedIndexBackend, fts5_available,
+                      get_backend, search_post_ids)
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Создаем посты и комментарии для поиска."""
+        cls.user = User.objects.create_user(username='Robot')
+        cls.title_post = Post.objects.create(
+            author=cls.user,
+            text='Робот собирает роботов на заводе',
+        )
+        cls.comment_post = Post.objects.create(
+            author=cls.user,
+            text='Пост без ключевого слова',
+        )
+        cls.comment = Comment.objects.create(
+            author=cls.user,
+            post=cls.comment_post,
+            text='Здесь тоже есть завод',
+        )
+        cls.other_post = Post.objects.create(
+            author=cls.user,
+            text='Совсем другой текст',
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_search_finds_posts_and_comments(self):
+        """Поиск находит посты по тексту и по комментариям,
+        совпадение в тексте поста ранжируется выше.
+        """
+        self.assertEqual(
+            search_post_ids('заводе'),
+            [SearchTests.title_post.pk]
+        )
+        self.assertNotIn(SearchTests.other_post.pk, search_post_ids('завод'))
+        self.assertIn(SearchTests.comment_post.pk, search_post_ids('завод'))
+
+    def test_search_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении."""
+        post = Post.objects.get(pk=SearchTests.other_post.pk)
+        post.text = 'Теперь про автоматизацию'
+        post.save()
+        self.assertEqual(search_post_ids('автоматизацию'), [post.pk])
+        self.assertEqual(search_post_ids('совсем'), [])
+        SearchTests.comment.delete()
+        self.assertEqual(search_post_ids('здесь'), [])
+
+    def test_inverted_index_backend(self):
+        """Запасной обратный индекс ищет по всем словам запроса."""
+        backend = InvertedIndexBackend()
+        backend.rebuild()
+        self.assertEqual(
+            backend.search('Робот заводе'),
+            [SearchTests.title_post.pk]
+        )
+        self.assertEqual(
+            set(backend.search('завод')),
+            {SearchTests.comment_post.pk}
+        )
+        self.assertEqual(backend.search('робот космос'), [])
+
+    def test_search_page(self):
+        """Страница поиска показывает найденные посты."""
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'робот'}
+        )
+        self.assertIn(
+            SearchTests.title_post,
+            response.context.get('page_obj').object_list
+        )
+        self.assertTemplateUsed(response, 'posts/search.html')
+
+    def test_backend_is_selected(self):
+        """Бэкенд поиска выбирается по возможностям базы."""
+        expected = Fts5Backend if fts5_available() else InvertedIndexBackend
+        self.assertIsInstance(get_backend(), expected)
+
+    @skipUnless(fts5_available(), 'SQLite собран без FTS5')
+    def test_fts_rows_removed_by_rowid(self):
+        """Строки поиска удаляются по rowid, без просмотра
+        всей таблицы FTS5.
+        """
+        backend = Fts5Backend()
+        with CaptureQueriesContext(connection) as queries:
+            backend.index_post(SearchTests.other_post)
+            backend.remove_comment(SearchTests.comment.pk)
+        deletes = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        with connection.cursor() as cursor:
+            for sql in deletes:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                detail = cursor.fetchone()[-1]
+                # FTS5 помечает ограничение на rowid как «=».
+                self.assertTrue(detail.endswith(':='), detail)
+        self.assertEqual(search_post_ids('здесь'), [])
+        self.assertEqual(search_post_ids('совсем'),
+                         [SearchTests.other_post.pk])
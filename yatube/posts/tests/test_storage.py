@@ -0,0 +1,108 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from ..models import MediaFile, Post
+from ..storage import content_storage
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEST_GIF = (
+    b"\x47\x49\x46\x38\x39\x61\x02\x00"
+    b"\x01\x00\x80\x00\x00\x00\x00\x00"
+    b"\xFF\xFF\xFF\x21\xF9\x04\x00\x00"
+    b"\x00\x00\x00\x2C\x00\x00\x00\x00"
+    b"\x02\x00\x01\x00\x00\x02\x02\x0C"
+    b"\x0A\x00\x3B"
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TransactionTestCase):
+    # Файлы удаляются в on_commit, поэтому транзакции настоящие.
+
+    @classmethod
+    def tearDownClass(cls):
+        """Удаляем тестовые медиа."""
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Фоновые миниатюры здесь не нужны и держали бы базу из потока.
+        patcher = mock.patch('posts.signals.schedule_thumbnails')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='Robot')
+
+    def create_post(self, file_name):
+        return Post.objects.create(
+            author=self.user,
+            text='Test post',
+            image=SimpleUploadedFile(
+                name=file_name,
+                content=TEST_GIF,
+                content_type='image/gif',
+            ),
+        )
+
+    def test_same_content_shares_file(self):
+        """Одинаковые загрузки хранятся одним файлом со счетчиком ссылок."""
+        first = self.create_post('meme.gif')
+        second = self.create_post('meme_copy.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            MediaFile.objects.get(name=first.image.name).references, 2
+        )
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл удаляется только вместе с последним постом."""
+        first = self.create_post('meme.gif')
+        second = self.create_post('meme.gif')
+        image_name = first.image.name
+        first.delete()
+        self.assertTrue(content_storage.exists(image_name))
+        self.assertEqual(MediaFile.objects.get(name=image_name).references, 1)
+        second.delete()
+        self.assertFalse(content_storage.exists(image_name))
+        self.assertFalse(MediaFile.objects.filter(name=image_name).exists())
+
+    def test_replaced_image_released(self):
+        """Замена картинки освобождает ссылку на старый файл."""
+        post = self.create_post('meme.gif')
+        old_name = post.image.name
+        post.image = SimpleUploadedFile(
+            name='other.gif',
+            content=TEST_GIF + b'\x00',
+            content_type='image/gif',
+        )
+        post.save()
+        self.assertNotEqual(post.image.name, old_name)
+        self.assertFalse(content_storage.exists(old_name))
+        self.assertEqual(
+            MediaFile.objects.get(name=post.image.name).references, 1
+        )
+
+    def test_upload_restores_file_deleted_concurrently(self):
+        """Если последнюю ссылку на файл сняли после того, как
+        хранилище пропустило запись существующего файла, загрузка
+        записывает файл заново.
+        """
+        first = self.create_post('meme.gif')
+        image_name = first.image.name
+        save = content_storage.save
+
+        def save_then_delete_first(*args, **kwargs):
+            name = save(*args, **kwargs)
+            first.delete()
+            return name
+
+        with mock.patch.object(content_storage, 'save',
+                               save_then_delete_first):
+            second = self.create_post('meme_copy.gif')
+        self.assertEqual(second.image.name, image_name)
+        self.assertTrue(content_storage.exists(image_name))
+        self.assertEqual(MediaFile.objects.get(name=image_name).references, 1)
@@ -0,0 +1,163 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from ..kvstore import LocalCachedKVStore
+from ..models import Post
+from ..storage import content_storage, delete_content
+from ..thumbnails import (RESPONSIVE_WIDTHS, generate_thumbnails,
+                          get_responsive_widths, get_thumbnail_geometries,
+                          schedule_thumbnails)
+
+User = get_user_model()
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Создаем пост с картинкой."""
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Robot')
+        # Оригинал уже самой широкой производной: она не создается.
+        cls.width = 1000
+        content = BytesIO()
+        Image.new('RGB', (cls.width, 400), 'white').save(content, 'GIF')
+        cls.test_gif = content.getvalue()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Удаляем тестовые медиа."""
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        """Каждому тесту -- своя картинка без готовых миниатюр."""
+        self.post = Post.objects.create(
+            author=ThumbnailTests.user,
+            text='Test post',
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=ThumbnailTests.test_gif,
+                content_type='image/gif'
+            ),
+        )
+
+    def tearDown(self):
+        """Одинаковые загрузки делят файл: убираем его с миниатюрами."""
+        delete_content(self.post.image.name)
+
+    def test_request_gets_original_until_thumbnail_ready(self):
+        """Пока миниатюры нет, шаблон получает оригинал,
+        после фоновой генерации -- готовую миниатюру.
+        """
+        geometry, options = get_thumbnail_geometries(ThumbnailTests.width)[0]
+        image = self.post.image
+        before = default.backend.get_thumbnail(image, geometry, **options)
+        self.assertEqual(before.name, image.name)
+        generate_thumbnails(image.name)
+        after = default.backend.get_thumbnail(image, geometry, **options)
+        self.assertNotEqual(after.name, image.name)
+        self.assertTrue(after.exists())
+        self.assertEqual(after.x, RESPONSIVE_WIDTHS[0])
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_no_workers_generate_inline(self):
+        """Без воркеров миниатюры готовы сразу после фиксации,
+        фоновый пул не используется.
+        """
+        image = self.post.image
+        geometry, options = get_thumbnail_geometries(ThumbnailTests.width)[0]
+        with patch('posts.thumbnails.transaction.on_commit',
+                   lambda callback: callback()), \
+                patch('posts.thumbnails.get_executor') as get_executor:
+            schedule_thumbnails(image.name)
+        get_executor.assert_not_called()
+        thumbnail = default.backend.get_thumbnail(image, geometry, **options)
+        self.assertNotEqual(thumbnail.name, image.name)
+
+    def test_responsive_image_srcset(self):
+        """Тег responsive_image отдает srcset всех ширин
+        не больше оригинала, когда производные готовы.
+        """
+        template = Template(
+            '{% load posts_tags %}{% responsive_image post.image %}'
+        )
+        context = Context({'post': self.post})
+        html = template.render(context)
+        self.assertIn(self.post.image.url, html)
+        self.assertNotIn('srcset', html)
+        generate_thumbnails(self.post.image.name)
+        html = template.render(context)
+        widths = get_responsive_widths(ThumbnailTests.width)
+        self.assertLess(len(widths), len(RESPONSIVE_WIDTHS))
+        for width in RESPONSIVE_WIDTHS:
+            with self.subTest(width=width):
+                if width in widths:
+                    self.assertIn(f' {width}w', html)
+                else:
+                    self.assertNotIn(f' {width}w', html)
+
+    def test_small_original_has_no_derivatives(self):
+        """Оригинал уже самой узкой производной отдается как есть."""
+        content = BytesIO()
+        Image.new('RGB', (100, 40), 'white').save(content, 'GIF')
+        post = Post.objects.create(
+            author=ThumbnailTests.user,
+            text='Small image',
+            image=SimpleUploadedFile(name='small.gif',
+                                     content=content.getvalue(),
+                                     content_type='image/gif'),
+        )
+        self.assertEqual(generate_thumbnails(post.image.name), 0)
+        html = Template(
+            '{% load posts_tags %}{% responsive_image post.image %}'
+        ).render(Context({'post': post}))
+        self.assertIn(post.image.url, html)
+        self.assertNotIn('srcset', html)
+        delete_content(post.image.name)
+
+    def test_render_without_thumbnail_queries(self):
+        """Повторная отрисовка картинки не ходит в базу за миниатюрами,
+        даже если кэш Django очищен.
+        """
+        template = Template(
+            '{% load posts_tags %}{% responsive_image post.image %}'
+        )
+        context = Context({'post': self.post})
+        generate_thumbnails(self.post.image.name)
+        template.render(context)
+        cache.clear()
+        with self.assertNumQueries(0):
+            html = template.render(context)
+        self.assertIn('srcset', html)
+
+    def test_warm_loads_recent_post_thumbnails(self):
+        """Прогрев загружает записи картинок последних постов
+        и их миниатюр.
+        """
+        generate_thumbnails(self.post.image.name)
+        store = LocalCachedKVStore()
+        self.assertGreater(store.warm(), 0)
+        cache.clear()
+        source = ImageFile(self.post.image.name, content_storage)
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(store.get(source))
+            thumbnails = store._get(source.key, identity='thumbnails')
+        self.assertEqual(
+            len(thumbnails),
+            len(get_thumbnail_geometries(ThumbnailTests.width)),
+        )
@@ -1,15 +1,26 @@
 # posts/tests/test_urls.py
-from django.test import TestCase, Client
+from django.test import (TestCase, TransactionTestCase, Client,
+                         override_settings)
 from django.contrib.auth import get_user_model
 from django.urls.base import reverse
 from http import HTTPStatus
 from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+from unittest import mock
+from ..caching import (acquire_refresh_lock, get_generation,
+                       release_refresh_lock, serve_stale_while_revalidate)
 from ..models import Post, Group
 
 
 User = get_user_model()
 
 
+# TestCase не фиксирует транзакции: поколения лент сбрасываются
+# сразу, как в режиме автофиксации.
+@mock.patch('posts.signals.transaction.on_commit',
+            lambda callback: callback())
 class PostURLTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -175,8 +186,8 @@ class PostURLTests(TestCase):
         )
 
     def test_cache_work(self):
-        """Проверяем что кеш хранит данные даже после удаления поста,
-        пост не показвается после принудельной очистки кеша.
+        """Проверяем что кеш хранит страницу, пока посты не менялись
+        через модель, и сбрасывается при удалении поста.
         """
         post = Post.objects.create(
             author=PostURLTests.user,
@@ -186,9 +197,203 @@ class PostURLTests(TestCase):
         addr = reverse('posts:index')
         response = self.guest_client.get(addr)
         self.assertContains(response, post)
-        post.delete()
+        Post.objects.filter(pk=post.pk).update(text='RobotUpdatedText')
         response_2 = self.guest_client.get(addr)
-        self.assertContains(response_2, post)
-        cache.clear()
+        self.assertContains(response_2, 'RobotCacheText')
+        post.delete()
         response_3 = self.guest_client.get(addr)
-        self.assertNotContains(response_3, post)
+        self.assertNotContains(response_3, 'RobotCacheText')
+        self.assertNotContains(response_3, 'RobotUpdatedText')
+
+    def test_cache_invalidated_for_group_and_profile(self):
+        """Новый пост сразу появляется в кэшированных лентах
+        группы и профиля.
+        """
+        addrs = [
+            reverse('posts:group_list',
+                    kwargs={'slug': PostURLTests.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': PostURLTests.user.username}),
+        ]
+        for addr in addrs:
+            self.guest_client.get(addr)
+        Post.objects.create(
+            author=PostURLTests.user,
+            text='RobotFreshText',
+            group=PostURLTests.group,
+        )
+        for addr in addrs:
+            with self.subTest(address=addr):
+                response = self.guest_client.get(addr)
+                self.assertContains(response, 'RobotFreshText')
+
+    @override_settings(FEED_CACHE_SOFT_TIMEOUT=0)
+    def test_stale_page_served_while_refreshing(self):
+        """Пока страницу перерисовывает другой запрос, отдается
+        устаревшая копия; следующий запрос обновляет ее.
+        """
+        addr = reverse('posts:index')
+        self.guest_client.get(addr)
+        # bulk_create не шлет сигналов: поколение ленты не меняется.
+        Post.objects.bulk_create([
+            Post(author=PostURLTests.user, text='RobotFreshText'),
+        ])
+        with mock.patch('posts.caching.acquire_refresh_lock',
+                        return_value=False):
+            response = self.guest_client.get(addr)
+        self.assertNotContains(response, 'RobotFreshText')
+        response = self.guest_client.get(addr)
+        self.assertContains(response, 'RobotFreshText')
+
+    @override_settings(FEED_CACHE_LOCK_WAIT=0)
+    def test_page_rendered_when_lock_holder_is_slow(self):
+        """Если копии нет и блокировка занята, запрос не ждет дольше
+        FEED_CACHE_LOCK_WAIT и рисует страницу сам.
+        """
+        Post.objects.create(
+            author=PostURLTests.user,
+            text='RobotLockedText',
+        )
+        with mock.patch('posts.caching.acquire_refresh_lock',
+                        return_value=False):
+            response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'RobotLockedText')
+
+    def test_waiters_not_held_by_uncacheable_page(self):
+        """Если ответ держателя блокировки нельзя кэшировать,
+        ждущие запросы не ждут FEED_CACHE_LOCK_WAIT и рисуют
+        страницу сами.
+        """
+        request = RequestFactory().get('/uncacheable/')
+        lock_key = 'feed:test:1:/uncacheable/'
+        self.assertTrue(acquire_refresh_lock(lock_key))
+
+        def render_private():
+            response = HttpResponse('private')
+            response['Cache-Control'] = 'private'
+            return response
+
+        def holder_finishes(interval):
+            # Пока ждущий спит, держатель рисует некэшируемый ответ.
+            release_refresh_lock(lock_key)
+            serve_stale_while_revalidate(request, 'feed:test:1',
+                                         render_private)
+
+        with mock.patch('posts.caching.time.sleep',
+                        side_effect=holder_finishes) as sleep:
+            response = serve_stale_while_revalidate(
+                request, 'feed:test:1', lambda: HttpResponse('fresh')
+            )
+        self.assertEqual(response.content, b'fresh')
+        self.assertEqual(sleep.call_count, 1)
+
+    def test_cached_pages_keep_per_user_parts(self):
+        """Кэшированная страница общая для всех, а шапка, кнопки
+        и форма комментария свои у каждого пользователя.
+        """
+        reader = User.objects.create_user(username='RobotReader')
+        reader_client = Client()
+        reader_client.force_login(reader)
+        addr_profile = reverse('posts:profile',
+                               kwargs={'username': PostURLTests.user})
+        addr_detail = reverse('posts:post_detail',
+                              kwargs={'post_id': PostURLTests.post.id})
+        addr_edit = reverse('posts:post_edit',
+                            kwargs={'post_id': PostURLTests.post.id})
+        addr_follow = reverse('posts:profile_follow',
+                              kwargs={'username': PostURLTests.user})
+        addr_logout = reverse('users:logout')
+        for addr in (addr_profile, addr_detail):
+            self.authorised_client.get(addr)
+        response = self.guest_client.get(addr_profile)
+        self.assertNotContains(response, addr_logout)
+        self.assertContains(response, addr_follow)
+        response = reader_client.get(addr_profile)
+        self.assertContains(response, 'Пользователь: RobotReader')
+        self.assertContains(response, addr_follow)
+        response = self.authorised_client.get(addr_profile)
+        self.assertNotContains(response, addr_follow)
+        response = self.guest_client.get(addr_detail)
+        self.assertNotContains(response, addr_edit)
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        response = reader_client.get(addr_detail)
+        self.assertNotContains(response, addr_edit)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        response = self.authorised_client.get(addr_detail)
+        self.assertContains(response, addr_edit)
+
+    def test_conditional_get_returns_not_modified(self):
+        """Неизменившаяся лента отдает 304 без запросов к базе,
+        новый пост или другой пользователь получают страницу.
+        """
+        addr = reverse('posts:index')
+        response = self.guest_client.get(addr)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(addr, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.authorised_client.get(addr, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        Post.objects.create(
+            author=PostURLTests.user,
+            text='RobotConditionalText',
+        )
+        response = self.guest_client.get(addr, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'RobotConditionalText')
+
+    def test_post_etag_follows_author_and_group(self):
+        """Страница поста меняет ETag и перерисовывается, когда
+        у автора выходит новый пост, меняется его имя или название
+        группы.
+        """
+        addr = reverse('posts:post_detail',
+                       kwargs={'post_id': PostURLTests.post.id})
+        etag = self.guest_client.get(addr)['ETag']
+        Post.objects.create(author=PostURLTests.user, text='Another post')
+        response = self.guest_client.get(addr, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Всего постов автора: <span>2</span>')
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+        author = User.objects.get(pk=PostURLTests.user.pk)
+        author.first_name = 'Renamed'
+        author.save()
+        response = self.guest_client.get(addr, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Renamed')
+        etag = response['ETag']
+        group = Group.objects.get(pk=PostURLTests.group.pk)
+        group.title = 'Renamed group'
+        group.save()
+        response = self.guest_client.get(addr, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Renamed group')
+
+    def test_last_modified_follows_feed_writes(self):
+        """Last-Modified -- время последней записи в ленту."""
+        Post.objects.create(
+            author=PostURLTests.user,
+            text='RobotModifiedText',
+        )
+        addr = reverse('posts:profile',
+                       kwargs={'username': PostURLTests.user.username})
+        last_modified = self.guest_client.get(addr)['Last-Modified']
+        response = self.guest_client.get(
+            addr, HTTP_IF_MODIFIED_SINCE=last_modified,
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+
+class FeedInvalidationCommitTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_generation_bumped_after_commit(self):
+        """Поколение ленты меняется только после фиксации: до нее
+        параллельный запрос закэшировал бы старые данные под новым
+        поколением.
+        """
+        user = User.objects.create_user(username='Robot')
+        generation = get_generation('index')
+        with transaction.atomic():
+            Post.objects.create(author=user, text='Test post')
+            self.assertEqual(get_generation('index'), generation)
+        self.assertNotEqual(get_generation('index'), generation)
@@ -5,7 +5,14 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.core.cache import cache
-from ..models import Post, Group, Comment, Follow
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch
+from ..models import (Post, Group, Comment, Follow, TimelineEntry,
+                      UserStats)
+from ..threads import REPLIES_PER_LEVEL
+from io import StringIO
 import shutil
 import tempfile
 
@@ -209,6 +216,60 @@ class PostViewTests(TestCase):
                     8
                 )
 
+    def test_cursor_paginator_correct_context(self):
+        """Страницы по курсору листаются вперед и назад
+        без пропусков и повторов.
+        """
+        objects_for_paginator = []
+        for i in range(0, 17):
+            new_post = Post(
+                author=PostViewTests.user,
+                text='Testing post ' + str(i),
+                group=PostViewTests.group
+            )
+            objects_for_paginator.append(new_post)
+        Post.objects.bulk_create(objects_for_paginator)
+        for addr in PostViewTests.urls_page_obj_list:
+            with self.subTest(address=addr):
+                cache.clear()
+                page_1 = self.authorized_client.get(
+                    addr
+                ).context.get('page_obj')
+                self.assertEqual(len(page_1), 10)
+                self.assertIsNone(page_1.previous_cursor)
+                page_2 = self.authorized_client.get(
+                    addr, {'cursor': page_1.next_cursor}
+                ).context.get('page_obj')
+                self.assertEqual(len(page_2), 8)
+                self.assertIsNone(page_2.next_cursor)
+                self.assertFalse(
+                    set(page_1.object_list) & set(page_2.object_list)
+                )
+                page_back = self.authorized_client.get(
+                    addr, {'cursor': page_2.previous_cursor}
+                ).context.get('page_obj')
+                self.assertEqual(page_back.object_list, page_1.object_list)
+
+    def test_paginator_count_cached_and_page_window(self):
+        """Число постов считается один раз на поколение ленты,
+        а ссылки ведут только на соседние страницы.
+        """
+        Post.objects.bulk_create(
+            Post(author=PostViewTests.user, text=f'Testing post {i}')
+            for i in range(69)
+        )
+        addr = reverse('posts:index')
+        self.authorized_client.get(addr, {'page': 1})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(addr, {'page': 4})
+        self.assertFalse(
+            [query for query in queries if 'COUNT(' in query['sql']]
+        )
+        self.assertEqual(
+            list(response.context.get('page_obj').page_window),
+            [2, 3, 4, 5, 6]
+        )
+
     def test_unable_create_comment_by_guest(self):
         """Проверяем что под гостем не создаются новые комментарии"""
         comments = Comment.objects.count()
@@ -313,3 +374,268 @@ class PostViewTests(TestCase):
             test_post,
             response.context.get('page_obj').object_list
         )
+
+    def test_follow_fills_and_unfollow_trims_timeline(self):
+        """Подписка переносит посты автора в ленту подписчика,
+        новые посты попадают в ленту сразу, отписка ленту очищает.
+        """
+        self.another_authorized_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': PostViewTests.user.username})
+        )
+        timeline = TimelineEntry.objects.filter(
+            user=PostViewTests.another_user
+        )
+        self.assertEqual(timeline.count(), 1)
+        new_post = Post.objects.create(
+            author=PostViewTests.user,
+            text='test_timeline_text',
+        )
+        self.assertTrue(timeline.filter(post=new_post).exists())
+        self.another_authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': PostViewTests.user.username})
+        )
+        self.assertFalse(timeline.exists())
+
+    @override_settings(TIMELINE_PULL_FOLLOWER_THRESHOLD=1)
+    def test_follow_index_merges_pull_authors(self):
+        """Посты авторов выше порога подписчиков не рассылаются
+        по лентам, но попадают в ленту подписок при чтении.
+        """
+        Follow.objects.create(user=self.third_user, author=self.user)
+        Follow.objects.create(user=self.another_user, author=self.user)
+        Follow.objects.create(
+            user=self.another_user, author=self.third_user
+        )
+        pulled_post = Post.objects.create(author=self.user, text='pull')
+        pushed_post = Post.objects.create(
+            author=self.third_user, text='push'
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=pulled_post).exists()
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(post=pushed_post).exists()
+        )
+        response = self.another_authorized_client.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(
+            response.context.get('page_obj').object_list,
+            [pushed_post, pulled_post, PostViewTests.post]
+        )
+
+    @override_settings(TIMELINE_PULL_FOLLOWER_THRESHOLD=1,
+                       TIMELINE_PUSH_FOLLOWER_THRESHOLD=1)
+    def test_unfollow_below_threshold_restores_timelines(self):
+        """Когда автор опускается до порога возврата, посты,
+        вышедшие в режиме чтения при запросе, остаются в лентах,
+        а команда restore_timelines дорассылает их.
+        """
+        Follow.objects.create(user=self.third_user, author=self.user)
+        Follow.objects.create(user=self.another_user, author=self.user)
+        pulled_post = Post.objects.create(author=self.user, text='pull')
+        self.third_authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': PostViewTests.user.username})
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=pulled_post).exists()
+        )
+        response = self.another_authorized_client.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(
+            response.context.get('page_obj').object_list,
+            [pulled_post, PostViewTests.post]
+        )
+        call_command('restore_timelines', stdout=StringIO())
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.another_user, post=pulled_post,
+            ).exists()
+        )
+        self.assertEqual(UserStats.objects.get(user=self.user).timeline_mode,
+                         UserStats.TIMELINE_PUSH)
+
+    @override_settings(TIMELINE_PULL_FOLLOWER_THRESHOLD=1,
+                       TIMELINE_PUSH_FOLLOWER_THRESHOLD=0)
+    def test_unfollow_above_push_threshold_keeps_pulling(self):
+        """Автор между порогами остается в режиме чтения:
+        отписка у границы не запускает рассылку.
+        """
+        Follow.objects.create(user=self.third_user, author=self.user)
+        Follow.objects.create(user=self.another_user, author=self.user)
+        Follow.objects.filter(user=self.third_user).delete()
+        call_command('restore_timelines', stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(user=self.user).timeline_mode,
+                         UserStats.TIMELINE_PULL)
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    @patch('posts.signals.transaction.on_commit',
+           lambda callback: callback())
+    def test_post_card_cache_invalidated_on_edit_and_rename(self):
+        """Закэшированная карточка поста обновляется после
+        редактирования поста и смены имени автора.
+        """
+        addr = reverse('posts:group_list',
+                       kwargs={'slug': PostViewTests.group.slug})
+        self.unauthorized_client.get(addr)
+        post = Post.objects.get(pk=PostViewTests.post.pk)
+        post.text = 'Edited robot post'
+        post.save()
+        self.assertContains(self.unauthorized_client.get(addr),
+                            'Edited robot post')
+        author = User.objects.get(pk=PostViewTests.user.pk)
+        author.first_name = 'Renamed'
+        author.save()
+        self.assertContains(self.unauthorized_client.get(addr), 'Renamed')
+
+    def test_post_detail_comments_paginated_and_load_more(self):
+        """На странице поста первая страница комментариев,
+        остальные догружаются по курсору фрагментом или JSON.
+        """
+        comments = [
+            Comment(author=PostViewTests.another_user,
+                    post=PostViewTests.post,
+                    text=f'Comment {i}')
+            for i in range(24)
+        ]
+        for comment in comments:
+            comment.build_path()
+        Comment.objects.bulk_create(comments)
+        addr = reverse('posts:post_detail',
+                       kwargs={'post_id': PostViewTests.post.id})
+        comments = self.authorized_client.get(addr).context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, 'Comment 23')
+        self.assertIsNotNone(comments.next_cursor)
+        more_addr = reverse('posts:post_comments',
+                            kwargs={'post_id': PostViewTests.post.id})
+        response = self.unauthorized_client.get(
+            more_addr, {'cursor': comments.next_cursor}
+        )
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['Comment 3', 'Comment 2', 'Comment 1', 'Comment 0',
+             PostViewTests.comment.text],
+        )
+        self.assertNotContains(response, 'data-comments-more')
+        response = self.unauthorized_client.get(
+            more_addr, {'cursor': comments.next_cursor, 'format': 'json'}
+        )
+        data = response.json()
+        self.assertIn('RobotComment', data['html'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_post_detail_renders_thread_with_replies_per_level(self):
+        """Ответы выводятся под родителем с отступом, первые
+        REPLIES_PER_LEVEL на уровень, остальные -- по ссылке.
+        """
+        root = PostViewTests.comment
+        replies = [
+            Comment.objects.create(author=PostViewTests.another_user,
+                                   post=PostViewTests.post,
+                                   parent=root, text=f'Reply {i}')
+            for i in range(REPLIES_PER_LEVEL + 2)
+        ]
+        nested = Comment.objects.create(author=PostViewTests.user,
+                                        post=PostViewTests.post,
+                                        parent=replies[-1], text='Nested')
+        addr = reverse('posts:post_detail',
+                       kwargs={'post_id': PostViewTests.post.id})
+        thread = self.authorized_client.get(addr).context['comments'].thread
+        self.assertEqual(
+            [(item.comment.text, item.depth) for item in thread],
+            [(root.text, 0), ('Reply 4', 1), ('Nested', 2),
+             ('Reply 3', 1), ('Reply 2', 1), (root.text, 1)],
+        )
+        more = thread[-1]
+        self.assertIsNotNone(more.more_cursor)
+        response = self.authorized_client.get(
+            reverse('posts:post_comments',
+                    kwargs={'post_id': PostViewTests.post.id}),
+            {'parent': root.id, 'cursor': more.more_cursor},
+        )
+        self.assertEqual(
+            [item.comment for item in response.context['comments'].thread],
+            [replies[1], replies[0]],
+        )
+        self.assertIn(nested, replies[-1].replies.all())
+
+    def test_reply_added_to_parent(self):
+        """Ответ сохраняется с родителем; комментарий другого
+        поста родителем не становится.
+        """
+        addr = reverse('posts:add_comment',
+                       kwargs={'post_id': PostViewTests.post.id})
+        self.authorized_client.post(
+            addr, {'text': 'Answer', 'parent': PostViewTests.comment.id}
+        )
+        answer = Comment.objects.get(text='Answer')
+        self.assertEqual(answer.parent, PostViewTests.comment)
+        self.assertEqual(answer.depth, 1)
+        other_post = Post.objects.create(author=PostViewTests.user,
+                                         text='Other post')
+        self.authorized_client.post(
+            reverse('posts:add_comment',
+                    kwargs={'post_id': other_post.id}),
+            {'text': 'Stranger', 'parent': PostViewTests.comment.id},
+        )
+        self.assertIsNone(Comment.objects.get(text='Stranger').parent)
+
+
+class FeedQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Создаем посты разных авторов в разных группах."""
+        cls.reader = User.objects.create_user(username='Reader')
+        authors = [
+            User.objects.create_user(username=f'Author{i}')
+            for i in range(3)
+        ]
+        groups = [
+            Group.objects.create(
+                title=f'Group {i}',
+                slug=f'group-{i}',
+                description='Testing description',
+            )
+            for i in range(3)
+        ]
+        for author in authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=authors[i % 3],
+                group=groups[i % 3],
+                text=f'Testing post {i}',
+            )
+            Comment.objects.create(post=cls.post, author=authors[i % 3],
+                                   text=f'Comment {i}')
+        cls.author = authors[0]
+        cls.group = groups[0]
+
+    def setUp(self):
+        self.client.force_login(FeedQueriesTests.reader)
+        cache.clear()
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        """Число запросов к базе на страницу ленты фиксировано."""
+        # Сессия и пользователь, затем запросы самого представления.
+        addr_queries = {
+            reverse('posts:index'): 2 + 1,
+            reverse('posts:group_list',
+                    kwargs={'slug': FeedQueriesTests.group.slug}): 2 + 2,
+            reverse(
+                'posts:profile',
+                kwargs={'username': FeedQueriesTests.author.username},
+            ): 2 + 4,
+            reverse('posts:follow_index'): 2 + 2,
+            reverse('posts:post_detail',
+                    kwargs={'post_id': FeedQueriesTests.post.id}): 2 + 5,
+        }
+        for addr, queries in addr_queries.items():
+            with self.subTest(address=addr):
+                with self.assertNumQueries(queries):
+                    self.client.get(addr)
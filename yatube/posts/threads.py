@@ -0,0 +1,111 @@
+from collections import Counter, namedtuple
+from operator import attrgetter
+
+from django.db.models import OuterRef, Subquery
+
+from .models import MAX_COMMENT_DEPTH, PATH_SEGMENT_WIDTH, Comment
+from .paginators import NEXT, KeysetPaginator, encode_cursor
+
+
+COMMENTS_PER_PAGE: int = 20
+REPLIES_PER_LEVEL: int = 3
+COMMENT_KEYS = ('created', 'id')
+
+# Строка дерева комментариев. Если more_cursor задан, это ссылка
+# «Показать еще ответы» на следующих детей comment.
+ThreadItem = namedtuple('ThreadItem', 'comment depth more_cursor')
+
+
+def get_thread_page(post, cursor=None, parent=None):
+    """Страница комментариев одного уровня (корневых или ответов
+    на parent), новые сверху, вместе с поддеревьями.
+
+    Поддеревья всех комментариев страницы читаются по запросу
+    на уровень; у каждого комментария показываются первые
+    REPLIES_PER_LEVEL ответов, остальные догружаются по курсору.
+    """
+    if parent is None:
+        level = post.comments.filter(depth=0)
+    else:
+        level = parent.replies.all()
+    paginator = KeysetPaginator(level.select_related('author'),
+                                COMMENTS_PER_PAGE, keys=COMMENT_KEYS)
+    page = paginator.get_cursor_page(cursor)
+    page.parent = parent
+    page.thread = build_thread(page.object_list,
+                               get_descendants(post, page.object_list))
+    return page
+
+
+def get_descendants(post, comments):
+    """Потомки комментариев одного уровня в порядке path.
+
+    Читается только то, что попадет в вывод: на каждом уровне
+    до MAX_COMMENT_DEPTH -- первые REPLIES_PER_LEVEL ответов
+    показанных комментариев и еще один, по которому видно,
+    что нужна ссылка «Показать еще ответы».
+    """
+    # Порядок ответов по path совпадает с (-created, -id) с точностью
+    # до совпадения времени, а по (-created, -id) идет индекс
+    # (parent, created).
+    first_replies = Comment.objects.filter(
+        parent=OuterRef('parent'),
+    ).order_by('-created', '-id').values('pk')[:REPLIES_PER_LEVEL + 1]
+    descendants = []
+    parents = [comment.pk for comment in comments]
+    depth = comments[0].depth if comments else MAX_COMMENT_DEPTH
+    while parents and depth < MAX_COMMENT_DEPTH:
+        replies = sorted(
+            post.comments.filter(
+                parent_id__in=parents,
+                pk__in=Subquery(first_replies),
+            ).select_related('author').order_by(),
+            key=attrgetter('path'),
+        )
+        descendants.extend(replies)
+        shown = Counter()
+        parents = []
+        for reply in replies:
+            shown[reply.parent_id] += 1
+            if shown[reply.parent_id] <= REPLIES_PER_LEVEL:
+                parents.append(reply.pk)
+        depth += 1
+    descendants.sort(key=attrgetter('path'))
+    return descendants
+
+
+def build_thread(comments, descendants):
+    """Раскладывает комментарии и их потомков в плоский список
+    ThreadItem в порядке вывода, чтобы шаблону не нужна была
+    рекурсия.
+    """
+    width = len(comments[0].path) if comments else 0
+    subtrees = {}
+    for reply in descendants:
+        subtrees.setdefault(reply.path[:width], []).append(reply)
+    thread = []
+    for comment in comments:
+        thread.append(ThreadItem(comment, comment.depth, None))
+        # Путь показанного комментария -> его показанные ответы.
+        shown = {comment.path: []}
+        nodes = {comment.path: comment}
+        for reply in subtrees.get(comment.path, ()):
+            parent_path = reply.path[:-PATH_SEGMENT_WIDTH]
+            siblings = shown.get(parent_path)
+            if siblings is None:
+                continue
+            if len(siblings) < REPLIES_PER_LEVEL:
+                siblings.append(reply)
+                shown[reply.path] = []
+                nodes[reply.path] = reply
+                thread.append(ThreadItem(reply, reply.depth, None))
+            elif len(siblings) == REPLIES_PER_LEVEL:
+                # Обход в порядке path: поддеревья показанных ответов
+                # уже выведены, ссылка встает сразу за ними.
+                last = siblings[-1]
+                siblings.append(reply)
+                cursor = encode_cursor(NEXT, (last.created, last.id))
+                thread.append(
+                    ThreadItem(nodes[parent_path], reply.depth, cursor)
+                )
+    return thread
@@ -0,0 +1,182 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .caching import bump_generation, get_group_scopes, get_profile_scopes
+from .models import Post
+from .storage import content_storage
+
+
+logger = logging.getLogger(__name__)
+
+# Карточка поста -- кадр 960x339; производные той же пропорции
+# нескольких ширин для srcset.
+RESPONSIVE_WIDTHS = (480, 960, 1440)
+ASPECT_RATIO = 339 / 960
+DEFAULT_WIDTH = 960
+FALLBACK_FORMAT = 'JPEG'
+MODERN_FORMATS = (
+    ('AVIF', 'image/avif'),
+    ('WEBP', 'image/webp'),
+)
+
+
+def get_modern_formats():
+    """Современные форматы, которые умеют сохранить и Pillow,
+    и sorl-thumbnail в этой установке.
+    """
+    Image.init()
+    return [
+        (image_format, mime_type)
+        for image_format, mime_type in MODERN_FORMATS
+        if image_format in EXTENSIONS and image_format in Image.SAVE
+    ]
+
+
+def get_geometry(width):
+    return '{}x{}'.format(width, round(width * ASPECT_RATIO))
+
+
+def get_responsive_widths(source_width):
+    # Увеличенная копия только добавляет байты: ширины больше
+    # оригинала в srcset не попадают.
+    return [width for width in RESPONSIVE_WIDTHS if width <= source_width]
+
+
+def get_derivative_options(image_format):
+    return {'crop': 'center', 'format': image_format}
+
+
+def get_thumbnail_geometries(source_width):
+    formats = [image_format for image_format, _ in get_modern_formats()]
+    return [
+        (get_geometry(width), get_derivative_options(image_format))
+        for image_format in [*formats, FALLBACK_FORMAT]
+        for width in get_responsive_widths(source_width)
+    ]
+
+
+_state = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def schedule_thumbnails(image_name):
+    """Ставит миниатюры в очередь после фиксации транзакции,
+    чтобы воркер увидел и файл, и запись поста.
+
+    При THUMBNAIL_WORKERS = 0 миниатюры создаются сразу,
+    в текущем потоке.
+    """
+    def submit():
+        with _executor_lock:
+            if image_name in _pending:
+                return
+            _pending.add(image_name)
+        if not settings.THUMBNAIL_WORKERS:
+            generate_thumbnails(image_name)
+            return
+        get_executor().submit(_generate_in_worker, image_name)
+
+    transaction.on_commit(submit)
+
+
+def generate_thumbnails(image_name):
+    """Создает производные картинки; возвращает их число."""
+    _state.generating = True
+    geometries = []
+    try:
+        # Ключи sorl учитывают хранилище: берем то же, что у поля.
+        source = default.kvstore.get_or_set(
+            ImageFile(image_name, content_storage),
+        )
+        geometries = get_thumbnail_geometries(source.width)
+        for geometry, options in geometries:
+            get_thumbnail(source, geometry, **options)
+        # Карточки и ленты, отрисованные с оригиналом вместо
+        # миниатюры, перерисуются уже с ней: у поста новая версия.
+        posts = Post.objects.filter(image=image_name)
+        posts.update(version=F('version') + 1)
+        for post in posts.only('author_id', 'group_id'):
+            bump_generation(
+                f'post:{post.pk}',
+                'index',
+                *get_profile_scopes(post.author_id),
+                *get_group_scopes(post.group_id),
+            )
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', image_name)
+        return 0
+    finally:
+        _state.generating = False
+        with _executor_lock:
+            _pending.discard(image_name)
+    return len(geometries)
+
+
+def _generate_in_worker(image_name):
+    try:
+        generate_thumbnails(image_name)
+    finally:
+        close_old_connections()
+
+
+class PregeneratingThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который не обрабатывает картинки
+    в потоке запроса.
+
+    Если миниатюры еще нет, генерация уходит в фоновый пул,
+    а шаблон получает оригинал картинки.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if getattr(_state, 'generating', False) or not file_:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        source = ImageFile(file_)
+        options = self._with_defaults(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        thumbnail = ImageFile(name, default.storage)
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        if thumbnail.exists():
+            default.kvstore.get_or_set(source)
+            default.kvstore.set(thumbnail, source)
+            return thumbnail
+        schedule_thumbnails(source.name)
+        return source
+
+    def _with_defaults(self, source, options):
+        # Та же подготовка параметров, что в ThumbnailBackend.get_thumbnail.
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
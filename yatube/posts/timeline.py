@@ -0,0 +1,260 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+
+BACKFILL_BATCH_SIZE: int = 500
+# Ключ сортировки ленты подписок. feed_id у материализованной части --
+# колонка post_id таблицы ленты, чтобы порядок целиком шел по индексу
+# (user, pub_date, post).
+TIMELINE_KEYS = ('feed_date', 'feed_id')
+
+
+class MergedFeed:
+    """K-путевое слияние нескольких лент, упорядоченных
+    по одному и тому же ключу.
+
+    Поддерживает ту часть интерфейса QuerySet, которой пользуется
+    паджинатор: filter, order_by, count и срезы.
+    """
+    ordered = True
+
+    def __init__(self, sources, keys):
+        self.sources = sources
+        self.keys = keys
+
+    def filter(self, *args, **kwargs):
+        return MergedFeed(
+            [source.filter(*args, **kwargs) for source in self.sources],
+            self.keys,
+        )
+
+    def order_by(self, *field_names):
+        keys = tuple(name.lstrip('-') for name in field_names)
+        return MergedFeed(
+            [source.order_by(*field_names) for source in self.sources],
+            keys,
+        )
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return self._merge()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return list(self[item:item + 1])[0]
+        start = item.start or 0
+        stop = item.stop
+        sources = self.sources
+        if stop is not None:
+            sources = [source[:stop] for source in sources]
+        return list(islice(self._merge(sources), start, stop))
+
+    def _merge(self, sources=None):
+        if sources is None:
+            sources = self.sources
+        descending = self._is_descending()
+
+        def sort_key(obj):
+            return tuple(getattr(obj, field) for field in self.keys)
+
+        return heapq.merge(*sources, key=sort_key, reverse=descending)
+
+    def _is_descending(self):
+        if not self.sources:
+            return True
+        ordering = self.sources[0].query.order_by
+        return bool(ordering) and ordering[0].startswith('-')
+
+
+# Авторы, чьи посты подмешиваются в ленту при чтении.
+PULLED_MODES = (UserStats.TIMELINE_PULL, UserStats.TIMELINE_RESTORE)
+
+
+def is_pull_author(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id,
+        timeline_mode=UserStats.TIMELINE_PULL,
+    ).exists()
+
+
+def get_pull_authors(user):
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__timeline_mode__in=PULLED_MODES,
+        ).values_list('author_id', flat=True)
+    )
+
+
+def start_pulling(author_ids=None):
+    """Переводит на чтение при запросе авторов, у которых
+    подписчиков стало больше TIMELINE_PULL_FOLLOWER_THRESHOLD.
+    """
+    stats = UserStats.objects.filter(
+        followers_count__gt=settings.TIMELINE_PULL_FOLLOWER_THRESHOLD,
+    ).exclude(timeline_mode=UserStats.TIMELINE_PULL)
+    if author_ids is not None:
+        stats = stats.filter(user_id__in=author_ids)
+    return stats.update(timeline_mode=UserStats.TIMELINE_PULL)
+
+
+def stop_pulling(author_ids=None):
+    """Авторов, у которых подписчиков стало не больше
+    TIMELINE_PUSH_FOLLOWER_THRESHOLD, отдает restore_timelines.
+
+    Порог возврата ниже порога перехода: автор у границы
+    не переключается туда и обратно на каждой подписке.
+    """
+    stats = UserStats.objects.filter(
+        timeline_mode=UserStats.TIMELINE_PULL,
+        followers_count__lte=settings.TIMELINE_PUSH_FOLLOWER_THRESHOLD,
+    )
+    if author_ids is not None:
+        stats = stats.filter(user_id__in=author_ids)
+    return stats.update(timeline_mode=UserStats.TIMELINE_RESTORE)
+
+
+def get_timeline(user):
+    """Лента подписок: чтение из материализованной таблицы
+    по индексу (user, pub_date) вместо соединения Post/Follow/User.
+
+    Посты авторов с большим числом подписчиков в таблицу
+    не рассылаются и подмешиваются слиянием при чтении.
+    """
+    pull_authors = get_pull_authors(user)
+    pushed = Post.objects.for_feed().filter(
+        timeline_entries__user=user,
+    ).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_id=F('timeline_entries__post'),
+    )
+    if not pull_authors:
+        return pushed
+    pushed = pushed.exclude(author_id__in=pull_authors)
+    pulled = [
+        Post.objects.for_feed().filter(
+            author_id=author_id,
+        ).annotate(
+            feed_date=F('pub_date'),
+            feed_id=F('id'),
+        )
+        for author_id in pull_authors
+    ]
+    return MergedFeed([pushed, *pulled], keys=TIMELINE_KEYS)
+
+
+def fan_out_post(post):
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id,
+    ).values_list('user_id', flat=True)
+    entries = [
+        TimelineEntry(
+            user_id=user_id,
+            post=post,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers.iterator()
+    ]
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=BACKFILL_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_timeline(follow):
+    start_pulling([follow.author_id])
+    if is_pull_author(follow.author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=follow.author_id,
+    ).values_list('id', 'pub_date')
+    entries = [
+        TimelineEntry(
+            user_id=follow.user_id,
+            post_id=post_id,
+            author_id=follow.author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts.iterator()
+    ]
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=BACKFILL_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def restore_author_timelines(author_id):
+    """Рассылает подписчикам последние TIMELINE_RESTORE_POSTS постов
+    автора, вернувшегося к рассылке: посты, вышедшие, пока его ленту
+    читали при запросе, в таблице лент отсутствуют.
+    """
+    posts = list(
+        Post.objects.filter(
+            author_id=author_id,
+        ).order_by('-pub_date').values_list(
+            'id', 'pub_date',
+        )[:settings.TIMELINE_RESTORE_POSTS]
+    )
+    followers = Follow.objects.filter(
+        author_id=author_id,
+    ).values_list('user_id', flat=True)
+    entries = (
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for user_id in followers.iterator()
+        for post_id, pub_date in posts
+    )
+    while True:
+        batch = list(islice(entries, BACKFILL_BATCH_SIZE))
+        if not batch:
+            break
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+    # Если автор за это время снова перешел порог, он остается
+    # на чтении.
+    UserStats.objects.filter(
+        user_id=author_id,
+        timeline_mode=UserStats.TIMELINE_RESTORE,
+    ).update(timeline_mode=UserStats.TIMELINE_PUSH)
+
+
+def restore_timelines():
+    """Возвращает к рассылке авторов в режиме TIMELINE_RESTORE
+    (для фонового запуска: команда restore_timelines).
+    """
+    start_pulling()
+    stop_pulling()
+    author_ids = list(
+        UserStats.objects.filter(
+            timeline_mode=UserStats.TIMELINE_RESTORE,
+        ).values_list('user_id', flat=True)
+    )
+    for author_id in author_ids:
+        restore_author_timelines(author_id)
+    return len(author_ids)
+
+
+def trim_timeline(follow):
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id,
+        author_id=follow.author_id,
+    ).delete()
+    stop_pulling([follow.author_id])
@@ -22,6 +22,14 @@ urlpatterns = [
          views.post_detail,
          name='post_detail'
          ),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments,
+         name='post_comments'
+         ),
+    path('search/',
+         views.search,
+         name='search'
+         ),
     path('create/',
          views.post_create,
          name='post_create'
@@ -1,27 +1,44 @@
 # posts/views.py
-from django.core.paginator import Paginator
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.decorators.cache import cache_page
 from django.contrib.auth.decorators import login_required
-from .models import Post, Group, User, Follow
+from django.db import transaction
+from django.template.loader import render_to_string
+from .models import Comment, Post, Group, User, Follow, VersionConflict
+from .caching import cache_feed, get_count_key, get_post_scopes
+from .comment_queue import submit_comment
+from .counters import get_user_stats
 from .forms import PostForm, CommentForm
+from .paginators import KeysetPaginator, WindowedPaginator
+from .routers import read_from_replica
+from .search import search_post_ids
+from .threads import get_thread_page
+from .timeline import TIMELINE_KEYS, get_timeline
 
 
 POSTS_PER_PAGE: int = 10
 
 
-def get_paginator(request, posts):
-    paginator = Paginator(posts, POSTS_PER_PAGE)
+def get_paginator(request, posts, keys=None, scope=None):
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        count_key = get_count_key(scope) if scope else None
+        paginator = KeysetPaginator(posts, POSTS_PER_PAGE, keys=keys,
+                                    count_key=count_key)
+        return paginator.get_page(page_number)
+    paginator = KeysetPaginator(posts, POSTS_PER_PAGE, keys=keys)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
 
 
-@cache_page(20, key_prefix='index_page')
+@cache_feed('index')
+@read_from_replica
 def index(request):
     template_index = 'posts/index.html'
-    posts_list = Post.objects.all()
-    page_obj = get_paginator(request, posts_list)
+    posts_list = Post.objects.for_feed()
+    page_obj = get_paginator(request, posts_list, scope='index')
     context = {
         'posts': posts_list,
         'page_obj': page_obj,
@@ -31,11 +48,13 @@ def index(request):
                   context=context)
 
 
+@cache_feed('group:{slug}')
+@read_from_replica
 def group_posts(request, slug):
     template_group_posts = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = get_paginator(request, posts)
+    posts = group.posts.for_feed(with_group=False)
+    page_obj = get_paginator(request, posts, scope=f'group:{slug}')
     context = {
         'group': group,
         'posts': posts,
@@ -46,37 +65,92 @@ def group_posts(request, slug):
                   context=context)
 
 
+@cache_feed('profile:{username}')
+@read_from_replica
 def profile(request, username):
     template_profile = 'posts/profile.html'
     text = 'Профайл пользователя'
     author = get_object_or_404(User, username=username)
-    following = (request.user.is_authenticated
-                 and request.user.follower.filter(author=author).exists())
-    posts_list = author.posts.all()
-    page_obj = get_paginator(request, posts_list)
+    posts_list = author.posts.for_feed(with_group=False)
+    page_obj = get_paginator(request, posts_list,
+                             scope=f'profile:{username}')
     context = {
         'text': text,
         'author': author,
+        'author_stats': get_user_stats(author),
         'page_obj': page_obj,
-        'following': following,
     }
     return render(request=request,
                   template_name=template_profile,
                   context=context)
 
 
+@cache_feed('post:{post_id}', depends_on=get_post_scopes)
+@read_from_replica
 def post_detail(request, post_id):
     template_post = 'posts/post_detail.html'
+    post_obj = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
+    context = {
+        'post': post_obj,
+        'author_stats': get_user_stats(post_obj.author),
+        'comments': get_thread_page(post_obj),
+    }
+    return render(request=request,
+                  template_name=template_post,
+                  context=context)
+
+
+@cache_feed('post:{post_id}')
+@read_from_replica
+def post_comments(request, post_id):
+    """Следующая страница комментариев для кнопки «Показать еще»:
+    HTML-фрагмент или, с ?format=json, JSON с фрагментом и курсором.
+
+    С ?parent=<id> листает ответы на этот комментарий.
+    """
+    template_comments = 'posts/includes/comment_list.html'
     post_obj = get_object_or_404(Post, id=post_id)
-    form = CommentForm(request.POST or None)
-    comments = post_obj.comments.all()
+    parent_id = request.GET.get('parent', '')
+    parent = None
+    if parent_id.isdigit():
+        parent = get_object_or_404(Comment, id=parent_id, post=post_obj)
+    comments = get_thread_page(post_obj, request.GET.get('cursor'),
+                               parent=parent)
     context = {
         'post': post_obj,
-        'form': form,
         'comments': comments,
     }
+    if request.GET.get('format') != 'json':
+        return render(request=request,
+                      template_name=template_comments,
+                      context=context)
+    return JsonResponse({
+        'html': render_to_string(template_comments, context,
+                                 request=request),
+        'next_cursor': comments.next_cursor,
+    })
+
+
+def search(request):
+    template_search = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    post_ids = search_post_ids(query) if query else []
+    paginator = WindowedPaginator(post_ids, POSTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    posts = Post.objects.for_feed().in_bulk(page_obj.object_list)
+    page_obj.object_list = [
+        posts[post_id] for post_id in page_obj.object_list
+        if post_id in posts
+    ]
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
     return render(request=request,
-                  template_name=template_post,
+                  template_name=template_search,
                   context=context)
 
 
@@ -97,7 +171,8 @@ def post_create(request):
                       context=context)
     post = form.save(commit=False)
     post.author = request.user
-    post.save()
+    with transaction.atomic():
+        post.save()
     return redirect('posts:profile',
                     username=request.user.username)
 
@@ -122,21 +197,33 @@ def post_edit(request, post_id):
             return render(request=request,
                           template_name=template_post_edit,
                           context=context)
-        form.save()
+        try:
+            with transaction.atomic():
+                form.save()
+        except VersionConflict:
+            form.add_error(None, 'Пост изменился, пока вы его правили. '
+                                 'Откройте его заново.')
+            return render(request=request,
+                          template_name=template_post_edit,
+                          context=context)
     return redirect('posts:post_detail',
                     post_id=post_id)
 
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post,
-                             id=post_id)
+    if not settings.COMMENT_WRITE_BEHIND:
+        # В очереди пост проверяется при записи пачки.
+        get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
-        comment.post = post
-        comment.save()
+        comment.post_id = post_id
+        parent_id = request.POST.get('parent', '')
+        if parent_id.isdigit():
+            comment.parent_id = int(parent_id)
+        submit_comment(comment)
     return redirect(
         'posts:post_detail',
         post_id=post_id,
@@ -144,11 +231,12 @@ def add_comment(request, post_id):
 
 
 @login_required
+@read_from_replica
 def follow_index(request):
     template_follow = 'posts/follow.html'
     title_text = 'Публикации избранных авторов'
-    posts_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_paginator(request, posts_list)
+    posts_list = get_timeline(request.user)
+    page_obj = get_paginator(request, posts_list, keys=TIMELINE_KEYS)
     context = {
         'title_text': title_text,
         'posts': posts_list,
@@ -166,10 +254,11 @@ def profile_follow(request, username):
     follow_author = get_object_or_404(User, username=username)
     follow_exist = request.user.follower.filter(author=follow_author).exists()
     if follow_author != request.user and not follow_exist:
-        Follow.objects.create(
-            user=request.user,
-            author=follow_author
-        )
+        with transaction.atomic():
+            Follow.objects.create(
+                user=request.user,
+                author=follow_author
+            )
     return redirect('posts:profile',
                     username)
 
@@ -179,6 +268,7 @@ def profile_unfollow(request, username):
     follow_author = get_object_or_404(User, username=username)
     data_follow = request.user.follower.filter(author=follow_author)
     if data_follow.exists():
-        data_follow.delete()
+        with transaction.atomic():
+            data_follow.delete()
     return redirect('posts:profile',
                     username)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -56,6 +57,8 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'posts.middleware.ReplicaRoutingMiddleware',
+    'posts.middleware.HoleFillingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -93,13 +96,26 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# SQLite в режиме WAL с настроенными PRAGMA (posts.db.sqlite3);
+# соединение переживает запрос и живет до CONN_MAX_AGE секунд.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'posts.db.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 60,
+    },
+    # Реплика для чтения лент; локально -- копия основной базы,
+    # которую обновляет manage.py sync_replica.
+    'replica': {
+        'ENGINE': 'posts.db.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -164,8 +180,120 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Общий для всех воркеров кэш на диске и небольшой LRU каждого
+# процесса перед ним (posts.cache_backends). Поколения лент
+# читаются только из общего кэша.
+#
+# В общем кэше страницы лент (по странице на поколение и курсор),
+# фрагменты, карточки постов и метаданные миниатюр -- десятки тысяч
+# записей. Файловый кэш при переполнении удаляет случайную
+# 1/CULL_FREQUENCY часть файлов, поэтому размер задан явно с запасом,
+# а блокировки перерисовки лент (posts.caching) лежат в своем
+# кэше, куда вытеснение общего не доходит.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'posts.cache_backends.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'LOCAL_BYPASS_PREFIXES': (
+                'feed_generation:',
+                'feed_modified:',
+            ),
+        },
+    },
+    'shared': {
+        'BACKEND': 'posts.cache_backends.SharedFileCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'yatube_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    'locks': {
+        'BACKEND': 'posts.cache_backends.SharedFileCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'yatube_locks'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
 }
+
+# Авторы, у которых подписчиков больше порога, не рассылают посты
+# по лентам подписчиков: их посты подмешиваются в ленту при чтении.
+TIMELINE_PULL_FOLLOWER_THRESHOLD = 1000
+
+# К рассылке автор возвращается, когда подписчиков стало не больше
+# этого порога; недавние посты ему дорассылает фоновая команда
+# restore_timelines -- столько, сколько нужно первой странице ленты.
+TIMELINE_PUSH_FOLLOWER_THRESHOLD = 900
+
+TIMELINE_RESTORE_POSTS = 10
+
+# Страницы лент кэшируются надолго: устаревшие версии отбрасываются
+# сменой поколения при изменении постов и групп (posts.caching).
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# Через мягкий срок страницу ленты перерисовывает один запрос под
+# блокировкой, остальные получают устаревшую копию (posts.caching).
+FEED_CACHE_SOFT_TIMEOUT = 20
+
+FEED_CACHE_LOCK_TIMEOUT = 10
+
+FEED_CACHE_LOCK_WAIT = 2
+
+# Миниатюры создаются фоновым пулом потоков (posts.thumbnails),
+# а не в потоке запроса.
+THUMBNAIL_BACKEND = 'posts.thumbnails.PregeneratingThumbnailBackend'
+
+# 0 -- миниатюры создаются сразу после фиксации в потоке запроса.
+# Тесты с картинками включают этот режим через override_settings:
+# фоновый поток пережил бы временный MEDIA_ROOT теста и записал бы
+# миниатюру в настоящий.
+THUMBNAIL_WORKERS = 2
+
+# Ограничения и нормализация картинок постов при загрузке (posts.images).
+POST_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+
+POST_IMAGE_MAX_EDGE = 2560
+
+# Метаданные миниатюр читаются из LRU в памяти процесса поверх кэша
+# Django; LRU прогревается картинками последних постов (posts.kvstore).
+THUMBNAIL_KVSTORE = 'posts.kvstore.LocalCachedKVStore'
+
+# Свой LRU у хранилища миниатюр уже есть: второй слой ему не нужен.
+THUMBNAIL_CACHE = 'shared'
+
+THUMBNAIL_LOCAL_CACHE_SIZE = 4096
+
+THUMBNAIL_LOCAL_CACHE_TIMEOUT = 60
+
+THUMBNAIL_WARM_POSTS = 100
+
+# Комментарии пишутся пачками из очереди в памяти процесса
+# (posts.comment_queue). До сброса очереди комментарий не виден
+# и теряется при падении процесса, поэтому режим выключен.
+COMMENT_WRITE_BEHIND = False
+
+COMMENT_BATCH_SIZE = 50
+
+COMMENT_BATCH_DELAY = 0.2
+
+COMMENT_QUEUE_LIMIT = 1000
+
+# Реплики, с которых читаются ленты (posts.routers). Пустой список --
+# все запросы идут в основную базу; локально реплику сначала
+# создает manage.py sync_replica.
+DATABASE_REPLICAS = []
+
+# После записи чтения пользователя идут в основную базу столько
+# секунд, сколько реплике нужно, чтобы догнать ее.
+REPLICA_STICKY_SECONDS = 10
+
+# Тесты пишут файловые кэши во временный каталог прогона,
+# а не в кэш запущенного рядом сервера.
+TEST_RUNNER = 'yatube.test_runner.TemporaryCacheRunner'
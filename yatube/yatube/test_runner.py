@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+FILE_CACHE_BACKENDS = (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'posts.cache_backends.SharedFileCache',
+)
+
+
+def temporary_caches(directory):
+    """Настройки CACHES, в которых файловые кэши лежат
+    в directory.
+    """
+    caches = {}
+    for alias, params in settings.CACHES.items():
+        params = dict(params)
+        if params['BACKEND'] in FILE_CACHE_BACKENDS:
+            params['LOCATION'] = os.path.join(directory, alias)
+        caches[alias] = params
+    return caches
+
+
+class TemporaryCacheRunner(DiscoverRunner):
+    """Запуск тестов с файловыми кэшами во временном каталоге:
+    тесты очищают кэш, и общий кэш сервера на этой машине
+    пострадал бы.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp(prefix='yatube_test_cache_')
+        self.cache_settings = override_settings(
+            CACHES=temporary_caches(self.cache_dir),
+        )
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)